@@ -1,68 +1,27 @@
 """
 QA Bot: A tool for answering questions based on PDF content
+
+Solution 1 is the "solution_1" preset of the shared pipeline in solution_2:
+2000-character chunks without section tagging or deduplication, MMR retrieval
+and contextual compression. This script only
+selects that preset; all pipeline code lives in solution_2.
 """
 
 import os
-import json
-import logging
-from pathlib import Path
-from dotenv import load_dotenv
-
-from pdf_extractor import PDFExtractor
-from chain import ChainManager
-from slack_post import SlackManager
-from cache_manager import CacheManager
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-# Load environment variables
-env_path = Path('env\.env') 
-load_dotenv(dotenv_path=env_path)
+import sys
+import importlib.util
 
-# Initialize API keys
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+# Make the shared pipeline modules importable
+SOLUTION_2_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "solution_2"))
+sys.path.insert(0, SOLUTION_2_DIR)
 
-# Set OpenAI API key
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+from pipeline import SOLUTION_1  # noqa: E402
 
-# SQLite database setup
-DB_PATH = 'qa_cache.db'
+# solution_2/main.py shares this script's module name, so load it under its own
+_spec = importlib.util.spec_from_file_location("solution_2_main", os.path.join(SOLUTION_2_DIR, "main.py"))
+shared_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(shared_main)
 
-def process_questions(qa_chain, questions: list, cache_manager: CacheManager) -> dict:
-    """
-    Process a list of questions and return results.
-
-    Args:
-        qa_chain: The question-answering chain.
-        questions (list): A list of questions to process.
-        cache_manager (CacheManager): The cache manager instance.
-
-    Returns:
-        dict: A dictionary containing the questions and their answers.
-    """
-    results = {}
-    for question in questions:
-        # Check if the question is in the cache
-        cached_result = cache_manager.get_cached_answer(question)
-        if cached_result:
-            logger.info(f"Cache hit for question: {question}")
-            results[question] = cached_result
-        else:
-            logger.info(f"Cache miss for question: {question}")
-            answer, sources = ChainManager.process_query(qa_chain, question)
-            result = {
-                "answer": answer,
-                "sources": [f"Page {doc.metadata.get('page', 'N/A')}" for doc in sources[:10]]
-            }
-            results[question] = result
-            
-            # Update the cache
-            cache_manager.cache_answer(question, answer, result["sources"])
-    
-    return results
 
 def main(pdf_path: str, questions: list) -> str:
     """
@@ -75,29 +34,7 @@ def main(pdf_path: str, questions: list) -> str:
     Returns:
         str: JSON string containing the questions and their answers.
     """
-    # Initialize managers
-    cache_manager = CacheManager(DB_PATH)
-    pdf_extractor = PDFExtractor()
-    chain_manager = ChainManager(OPENAI_API_KEY)
-    slack_manager = SlackManager(SLACK_BOT_TOKEN)
-
-    # Process PDF
-    pages = pdf_extractor.get_pdf_text(pdf_path)
-    text_chunks = pdf_extractor.get_text_chunks(pages)
-    vectorstore = pdf_extractor.get_vectorstore(text_chunks, pdf_path)
-    qa_chain = chain_manager.create_advanced_chain(vectorstore)
-
-    # Process questions and get answers
-    results = process_questions(qa_chain, questions, cache_manager)
-
-    # Convert results to JSON
-    json_results = json.dumps(results, indent=2)
-
-    # Post results to Slack
-    slack_channel = "#qa"
-    slack_manager.post_to_slack(slack_channel, f"AI Agent Results:\n```{json_results}```")
-
-    return json_results
+    return shared_main.main(pdf_path, questions, config=SOLUTION_1)
 
 if __name__ == "__main__":
     # Example usage
@@ -109,4 +46,4 @@ if __name__ == "__main__":
         "What is the termination policy?"
     ]
     results = main(pdf_path, questions)
-    print(results)
\ No newline at end of file
+    print(results)
@@ -0,0 +1,256 @@
+"""
+batch.py: Batch question answering over many PDFs.
+
+This script reads a JSONL manifest of jobs, one PDF and its questions per line,
+fans the documents out across a pool of worker processes and streams one JSON
+line per finished job to an output file. The output file doubles as the
+checkpoint: jobs already written successfully are skipped when a run is
+restarted, and answers are cached per document so that questions answered
+before a crash are not paid for again. A job rerun after an error or failed
+questions is appended as a new record, so when the output holds several
+records with the same id, the last one wins.
+
+Usage:
+    python batch.py manifest.jsonl results.jsonl --workers 4
+
+Manifest lines look like:
+    {"id": "acme", "pdf": "data/acme.pdf", "questions": ["Who is the CEO of the company?"]}
+"id" defaults to the PDF path and "questions" to the standard question set.
+"""
+
+import os
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set
+
+from pdf_extractor import PDFExtractor
+from chain import ChainManager
+from cache_manager import CacheManager
+from llm_cache import LLMCache
+from rate_limiter import DEFAULT_CHAT_LIMITS, DEFAULT_EMBEDDING_LIMITS, configure_rate_limiter, get_rate_limiter
+from cache_backend import create_cache_backend
+from main import OPENAI_API_KEY, CACHE_URL, LLM_CACHE_PATH, DEFAULT_QUESTIONS, build_qa_chain, process_questions
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Per-process state, created once by each worker
+_pdf_extractor = None
+_chain_manager = None
+_cache_backend = None
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, Any]]:
+    """
+    Read the jobs of a JSONL manifest.
+
+    Args:
+    manifest_path (str): Path to the manifest file
+
+    Returns:
+    list: Jobs with "id", "pdf" and "questions" keys
+    """
+    jobs = []
+    seen_ids = set()
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line_number, line in enumerate(manifest, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict):
+                    raise ValueError("a manifest line must be a JSON object")
+                job = {
+                    "id": str(entry.get("id", entry["pdf"])),
+                    "pdf": entry["pdf"],
+                    "questions": entry.get("questions") or DEFAULT_QUESTIONS,
+                }
+                if not isinstance(job["questions"], list) or not all(isinstance(q, str) for q in job["questions"]):
+                    raise ValueError('"questions" must be a list of strings')
+            except (ValueError, KeyError) as e:
+                logger.error(f"Skipping invalid manifest line {line_number}: {e}")
+                continue
+            if job["id"] in seen_ids:
+                logger.warning(f"Skipping duplicate job id '{job['id']}' on manifest line {line_number}")
+                continue
+            seen_ids.add(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+def load_completed(output_path: str) -> Set[str]:
+    """
+    Collect the ids of jobs already written successfully to the output file.
+
+    A job counts as completed only if its last record was written without an
+    error and every one of its questions was answered.
+
+    Args:
+    output_path (str): Path to the output JSONL file
+
+    Returns:
+    set: Ids of completed jobs
+    """
+    succeeded: Dict[str, bool] = {}
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, encoding="utf-8") as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; the job will simply run again
+                continue
+            # Records of a rerun job are appended, so the last one wins
+            succeeded[record["id"]] = "error" not in record and not record.get("failed_questions")
+    return {job_id for job_id, success in succeeded.items() if success}
+
+
+def truncate_partial_line(output_path: str):
+    """
+    Cut the output file back to its last complete line.
+
+    A crash can leave half a record at the end of the file; appending to it
+    would glue the next record onto that half line.
+
+    Args:
+    output_path (str): Path to the output JSONL file
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as output:
+        end = output.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            output.seek(start)
+            newline = output.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            logger.warning(f"Dropping {end - position} bytes of a partially written record from {output_path}")
+            output.truncate(position)
+
+
+def _init_worker(workers: int):
+    """
+    Create the extractor, chain manager and answer cache backend once per worker process.
+
+    Args:
+    workers (int): Number of worker processes sharing the OpenAI quota
+    """
+    global _pdf_extractor, _chain_manager, _cache_backend
+    # Rate limiters are per process, so each worker gets an equal share of the quota
+    for model, limits in ((ChainManager.MODEL_NAME, DEFAULT_CHAT_LIMITS),
+                          (PDFExtractor.EMBEDDING_MODEL, DEFAULT_EMBEDDING_LIMITS)):
+        limiter = get_rate_limiter(model, limits)
+        configure_rate_limiter(model, max(1, int(limiter.requests.capacity // workers)),
+                               max(1, int(limiter.tokens.capacity // workers)))
+    _pdf_extractor = PDFExtractor()
+    _chain_manager = ChainManager(OPENAI_API_KEY, llm_cache=LLMCache(LLM_CACHE_PATH))
+    _cache_backend = create_cache_backend(CACHE_URL)
+
+
+def run_job(job: Dict[str, Any], budget: Optional[float] = None, batch_questions: bool = False) -> Dict[str, Any]:
+    """
+    Answer the questions of one job.
+
+    Args:
+    job (dict): The job, with "id", "pdf" and "questions" keys
+    budget (float): Optional per-question latency budget in seconds
+    batch_questions (bool): Answer questions sharing retrieved context in a single LLM call
+
+    Returns:
+    dict: The output record of the job; questions that could not be answered are listed under "failed_questions"
+    """
+    try:
+        # Answers are cached per document, so a rerun only pays for unanswered questions
+        cache_manager = CacheManager(namespace=PDFExtractor.get_pdf_id(job["pdf"]), backend=_cache_backend)
+        qa_chain = build_qa_chain(job["pdf"], _pdf_extractor, _chain_manager, budget=budget)
+        results = process_questions(qa_chain, job["questions"], cache_manager, budget=budget, batch_questions=batch_questions)
+        record = {"id": job["id"], "pdf": job["pdf"], "results": results}
+        # Failed questions have no tier; the job stays incomplete so a resumed run retries them
+        failed_questions = [question for question, result in results.items() if result.get("tier") is None]
+        if failed_questions:
+            logger.warning(f"Job '{job['id']}' has {len(failed_questions)} unanswered questions")
+            record["failed_questions"] = failed_questions
+        return record
+    except Exception as e:
+        logger.error(f"Error processing job '{job['id']}': {e}")
+        return {"id": job["id"], "pdf": job["pdf"], "error": str(e)}
+
+
+def run_batch(manifest_path: str, output_path: str, workers: int = 4, budget: Optional[float] = None,
+              batch_questions: bool = False) -> int:
+    """
+    Run every unfinished job of a manifest and append the results to the output file.
+
+    Args:
+    manifest_path (str): Path to the JSONL manifest
+    output_path (str): Path to the JSONL output file, also used as the checkpoint
+    workers (int): Number of worker processes
+    budget (float): Optional per-question latency budget in seconds
+    batch_questions (bool): Answer questions sharing retrieved context in a single LLM call
+
+    Returns:
+    int: Number of jobs that failed
+    """
+    jobs = load_manifest(manifest_path)
+    completed = load_completed(output_path)
+    pending = [job for job in jobs if job["id"] not in completed]
+    truncate_partial_line(output_path)
+    logger.info(f"{len(jobs)} jobs in manifest, {len(jobs) - len(pending)} already completed, {len(pending)} to run")
+
+    failures = 0
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as executor:
+        futures = {executor.submit(run_job, job, budget, batch_questions): job for job in pending}
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker process itself died
+                job = futures[future]
+                record = {"id": job["id"], "pdf": job["pdf"], "error": str(e)}
+            if "error" in record or record.get("failed_questions"):
+                failures += 1
+
+            # Make each finished job durable before moving on
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+            logger.info(f"Finished job '{record['id']}'")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parse command-line arguments and run the batch.
+
+    Args:
+    argv (list): Command-line arguments, defaults to sys.argv
+
+    Returns:
+    int: Process exit code
+    """
+    parser = argparse.ArgumentParser(description="Answer questions over many PDFs listed in a JSONL manifest.")
+    parser.add_argument("manifest", help="JSONL manifest of jobs")
+    parser.add_argument("output", help="JSONL output file; rerunning with the same file resumes the batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--budget", type=float, default=None, help="Per-question latency budget in seconds")
+    parser.add_argument("--batch-questions", action="store_true",
+                        help="Answer questions sharing retrieved context in a single LLM call")
+    args = parser.parse_args(argv)
+
+    failures = run_batch(args.manifest, args.output, workers=args.workers, budget=args.budget,
+                         batch_questions=args.batch_questions)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
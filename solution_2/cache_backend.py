@@ -0,0 +1,495 @@
+"""
+cache_backend.py: Storage backends for the question-answer cache.
+
+This module abstracts where CacheManager keeps its entries. The SQLite backend
+keeps the existing single-file cache. The RESP backend talks the Redis wire
+protocol to a shared key-value server, so that answers cached by one replica
+of the bot serve every replica. Batch lookups and writes are pipelined over a
+small pool of persistent connections. InProcessRespServer is a minimal
+stand-in server for running the RESP backend locally without a Redis install.
+"""
+
+import json
+import time
+import queue
+import socket
+import sqlite3
+import logging
+import threading
+import socketserver
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# An entry holds the "question", "answer" and "sources" of a cached answer
+Entry = Dict[str, Any]
+
+
+class CacheBackend(ABC):
+    """
+    Key-value storage of cache entries.
+    """
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> List[Optional[Entry]]:
+        """
+        Look up several entries at once.
+
+        Args:
+        keys (List[str]): The keys to look up
+
+        Returns:
+        List[Optional[dict]]: The entry of each key, in order, or None where it is missing
+        """
+
+    @abstractmethod
+    def set_many(self, entries: Dict[str, Entry]):
+        """
+        Store several entries at once.
+
+        Args:
+        entries (dict): Mapping of key to entry
+        """
+
+    def get(self, key: str) -> Optional[Entry]:
+        """Look up a single entry."""
+        return self.get_many([key])[0]
+
+    def set(self, key: str, entry: Entry):
+        """Store a single entry."""
+        self.set_many({key: entry})
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Stores entries in the qa_cache table of a local SQLite database.
+    """
+
+    # Stay below SQLite's default limit on bound parameters per statement
+    MAX_VARIABLES = 500
+
+    def __init__(self, db_path: str):
+        """
+        Initialize the backend and create the table if needed.
+
+        Args:
+        db_path (str): Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database with the required table."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS qa_cache (
+                question_hash TEXT PRIMARY KEY,
+                question TEXT,
+                answer TEXT,
+                sources TEXT
+            )
+            ''')
+            conn.commit()
+
+    def get_many(self, keys: List[str]) -> List[Optional[Entry]]:
+        found: Dict[str, Entry] = {}
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(keys), self.MAX_VARIABLES):
+                batch = keys[start:start + self.MAX_VARIABLES]
+                cursor.execute(
+                    f"SELECT question_hash, question, answer, sources FROM qa_cache "
+                    f"WHERE question_hash IN ({', '.join('?' * len(batch))})",
+                    batch
+                )
+                for key, question, answer, sources in cursor.fetchall():
+                    found[key] = {"question": question, "answer": answer, "sources": json.loads(sources)}
+        return [found.get(key) for key in keys]
+
+    def set_many(self, entries: Dict[str, Entry]):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT OR REPLACE INTO qa_cache (question_hash, question, answer, sources) VALUES (?, ?, ?, ?)",
+                [(key, entry["question"], entry["answer"], json.dumps(entry["sources"])) for key, entry in entries.items()]
+            )
+            conn.commit()
+
+
+class RespError(Exception):
+    """Error reply from a RESP server."""
+
+
+def _encode_command(*args) -> bytes:
+    """
+    Encode a command as a RESP array of bulk strings.
+
+    Args:
+    *args: The command name and its arguments
+
+    Returns:
+    bytes: The encoded command
+    """
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def _read_reply(stream) -> Any:
+    """
+    Read one RESP reply.
+
+    Args:
+    stream: Buffered binary stream of the connection
+
+    Returns:
+    The decoded reply; error replies are returned as RespError instances so that
+    one failed command does not desynchronise a pipeline
+
+    Raises:
+    ConnectionError: If the connection is closed mid-reply
+    """
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the cache server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    if kind == b"-":
+        return RespError(payload.decode("utf-8"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed by the cache server")
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [_read_reply(stream) for _ in range(length)]
+    raise ConnectionError(f"Unexpected RESP reply type: {kind!r}")
+
+
+class _RespConnection:
+    """
+    One persistent connection to a RESP server.
+    """
+
+    def __init__(self, host: str, port: int, db: int, password: Optional[str], timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile("rb")
+        if password:
+            self.execute(["AUTH", password])
+        if db:
+            self.execute(["SELECT", db])
+
+    def pipeline(self, commands: List[List[Any]]) -> List[Any]:
+        """
+        Send several commands in one write and read all their replies.
+
+        Args:
+        commands (list): The commands, each a list of the name and arguments
+
+        Returns:
+        list: The reply of each command, in order
+        """
+        self.sock.sendall(b"".join(_encode_command(*command) for command in commands))
+        return [_read_reply(self.stream) for _ in commands]
+
+    def execute(self, command: List[Any]) -> Any:
+        """Send one command and return its reply, raising RespError on an error reply."""
+        reply = self.pipeline([command])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def close(self):
+        try:
+            self.stream.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespCacheBackend(CacheBackend):
+    """
+    Stores entries as JSON values on a shared Redis-compatible key-value server.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 prefix: str = "qa_cache:", ttl: Optional[int] = None, pool_size: int = 8, timeout: float = 5.0):
+        """
+        Initialize the backend. Connections are opened lazily and reused.
+
+        Args:
+        host (str): Host of the key-value server
+        port (int): Port of the key-value server
+        db (int): Database number to select
+        password (str): Optional password sent with AUTH
+        prefix (str): Prefix added to every key, keeping cache entries apart from other data on the server
+        ttl (int): Optional expiry of entries, in seconds
+        pool_size (int): Maximum number of open connections
+        timeout (float): Socket timeout, in seconds
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.ttl = ttl
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[_RespConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RespCacheBackend":
+        """
+        Create a backend from a URL such as redis://:password@host:6379/0.
+
+        Args:
+        url (str): The server URL
+        **kwargs: Further keyword arguments for the backend
+
+        Returns:
+        RespCacheBackend: The backend
+        """
+        parsed = urlparse(url)
+        db = parsed.path.strip("/")
+        return cls(host=parsed.hostname or "localhost", port=parsed.port or 6379, db=int(db) if db else 0,
+                   password=parsed.password, **kwargs)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Entry]]:
+        if not keys:
+            return []
+        values = self._pipeline([["MGET", *(self.prefix + key for key in keys)]])[0]
+        return [json.loads(value) if value is not None else None for value in values]
+
+    def set_many(self, entries: Dict[str, Entry]):
+        if not entries:
+            return
+        expiry = ["EX", self.ttl] if self.ttl else []
+        self._pipeline([["SET", self.prefix + key, json.dumps(entry), *expiry] for key, entry in entries.items()])
+
+    def ping(self) -> bool:
+        """Check that the server is reachable."""
+        return self._pipeline([["PING"]])[0] == "PONG"
+
+    def close(self):
+        """Close every idle connection of the pool."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _pipeline(self, commands: List[List[Any]]) -> List[Any]:
+        """
+        Run commands as one pipeline on a pooled connection.
+
+        Args:
+        commands (list): The commands, each a list of the name and arguments
+
+        Returns:
+        list: The reply of each command, in order
+
+        Raises:
+        RespError: If any command got an error reply
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for a cache server connection")
+        connection = None
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = _RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+            replies = connection.pipeline(commands)
+        except Exception:
+            # A connection in an unknown state must not go back to the pool
+            if connection is not None:
+                connection.close()
+            self._slots.release()
+            raise
+        self._idle.put(connection)
+        self._slots.release()
+
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+
+def create_cache_backend(url: str) -> CacheBackend:
+    """
+    Create the cache backend configured by a URL.
+
+    Args:
+    url (str): redis://host:port/db for a shared server, or an SQLite database path,
+        optionally written as sqlite:///path
+
+    Returns:
+    CacheBackend: The backend
+    """
+    if url.startswith(("redis://", "resp://")):
+        backend = RespCacheBackend.from_url(url)
+        logger.info(f"Using shared answer cache at {backend.host}:{backend.port}")
+        return backend
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteCacheBackend(url)
+
+
+class _RespRequestHandler(socketserver.StreamRequestHandler):
+    """Serves the RESP commands of one client connection."""
+
+    def handle(self):
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            name = command[0].decode("utf-8").upper()
+            try:
+                reply = self.server.execute(name, command[1:])
+            except Exception as e:
+                reply = RespError(f"ERR {e}")
+            self.wfile.write(self._encode_reply(reply))
+
+    @classmethod
+    def _encode_reply(cls, reply: Any) -> bytes:
+        if isinstance(reply, RespError):
+            return b"-%s\r\n" % str(reply).encode("utf-8")
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode("utf-8")
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(cls._encode_reply(item) for item in reply)
+
+
+class InProcessRespServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal in-memory RESP server for running RespCacheBackend without Redis.
+
+    Supports PING, AUTH, SELECT, GET, SET (with EX/PX), MGET, MSET, DEL, EXISTS, DBSIZE and FLUSHDB.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Bind the server; port 0 picks a free port.
+
+        Args:
+        host (str): Host to bind to
+        port (int): Port to bind to
+        """
+        super().__init__((host, port), _RespRequestHandler)
+        self._data: Dict[bytes, bytes] = {}
+        self._expiry: Dict[bytes, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """URL to pass to create_cache_backend or RespCacheBackend.from_url."""
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "InProcessRespServer":
+        """Serve requests in a background daemon thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name="resp-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def execute(self, name: str, args: List[bytes]) -> Any:
+        """
+        Execute one command.
+
+        Args:
+        name (str): Upper-case command name
+        args (list): The command arguments
+
+        Returns:
+        The reply of the command
+        """
+        with self._lock:
+            if name == "PING":
+                return "PONG"
+            if name in ("AUTH", "SELECT"):
+                return "OK"
+            if name == "GET":
+                return self._get(args[0])
+            if name == "MGET":
+                return [self._get(key) for key in args]
+            if name == "SET":
+                ttl = None
+                if len(args) >= 4 and args[2].upper() in (b"EX", b"PX"):
+                    ttl = int(args[3]) / (1 if args[2].upper() == b"EX" else 1000)
+                self._set(args[0], args[1], ttl)
+                return "OK"
+            if name == "MSET":
+                for key, value in zip(args[::2], args[1::2]):
+                    self._set(key, value, None)
+                return "OK"
+            if name == "DEL":
+                return sum(self._delete(key) for key in args)
+            if name == "EXISTS":
+                return sum(self._get(key) is not None for key in args)
+            if name == "DBSIZE":
+                return sum(self._get(key) is not None for key in list(self._data))
+            if name == "FLUSHDB":
+                self._data.clear()
+                self._expiry.clear()
+                return "OK"
+        return RespError(f"ERR unknown command '{name}'")
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        expires = self._expiry.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._delete(key)
+        return self._data.get(key)
+
+    def _set(self, key: bytes, value: bytes, ttl: Optional[float]):
+        self._data[key] = value
+        if ttl is None:
+            self._expiry.pop(key, None)
+        else:
+            self._expiry[key] = time.monotonic() + ttl
+
+    def _delete(self, key: bytes) -> int:
+        self._expiry.pop(key, None)
+        return int(self._data.pop(key, None) is not None)
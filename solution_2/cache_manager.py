@@ -1,43 +1,52 @@
 """
-cache_manager.py: Manages caching of question-answer pairs in a SQLite database.
+cache_manager.py: Manages caching of question-answer pairs.
 
 This module provides functionality to store and retrieve cached answers
-for questions, improving response time for repeated queries.
+for questions, improving response time for repeated queries. Entries are
+kept in a pluggable backend: a local SQLite database by default, or a
+shared key-value server so that all replicas of the bot share one cache.
 """
 
-import sqlite3
-import json
 import hashlib
-from typing import Dict, Any, List, Union
+from typing import Dict, Any, List, Optional, Union
+
+from cache_backend import CacheBackend, SQLiteCacheBackend
 
 class CacheManager:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: Optional[str] = None, namespace: Optional[str] = None,
+                 backend: Optional[CacheBackend] = None):
         """
-        Initialize the CacheManager with the path to the SQLite database.
+        Initialize the CacheManager with the path to the SQLite database or a cache backend.
 
         Args:
-        db_path (str): Path to the SQLite database file
+        db_path (str): Path to the SQLite database file, used when no backend is given
+        namespace (str): Optional namespace, e.g. a document id, keeping answers about different documents apart
+        backend (CacheBackend): Optional backend storing the entries, e.g. a shared RespCacheBackend
         """
+        if backend is None:
+            if db_path is None:
+                raise ValueError("Either db_path or backend is required")
+            backend = SQLiteCacheBackend(db_path)
         self.db_path = db_path
-        self.init_db()
-
-    def init_db(self):
-        """Initialize the SQLite database with the required table."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS qa_cache (
-                question_hash TEXT PRIMARY KEY,
-                question TEXT,
-                answer TEXT,
-                sources TEXT
-            )
-            ''')
-            conn.commit()
+        self.namespace = namespace
+        self.backend = backend
+
+    def for_tier(self, tier: str) -> "CacheManager":
+        """
+        Return a cache on the same backend keeping the answers of a pipeline tier apart.
+
+        Args:
+        tier (str): The tier, e.g. "batched" for answers made without contextual compression
+
+        Returns:
+        CacheManager: The cache of the tier's answers
+        """
+        namespace = tier if self.namespace is None else f"{self.namespace}\x00{tier}"
+        return CacheManager(db_path=self.db_path, namespace=namespace, backend=self.backend)
 
     def get_cached_answer(self, question: str) -> Union[Dict[str, Union[str, List[str]]], None]:
         """
-        Retrieve a cached answer from the database.
+        Retrieve a cached answer from the backend.
 
         Args:
         question (str): The question to look up
@@ -45,52 +54,72 @@ class CacheManager:
         Returns:
         dict or None: A dictionary containing the answer and sources if found, None otherwise
         """
-        question_hash = self._compute_question_hash(question)
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT answer, sources FROM qa_cache WHERE question_hash = ?", (question_hash,))
-            result = cursor.fetchone()
+        return self.get_cached_answers([question])[question]
+
+    def get_cached_answers(self, questions: List[str]) -> Dict[str, Union[Dict[str, Union[str, List[str]]], None]]:
+        """
+        Retrieve the cached answers of several questions with a single backend round trip.
 
-        if result:
-            return {"answer": result[0], "sources": json.loads(result[1])}
-        return None
+        Args:
+        questions (List[str]): The questions to look up
+
+        Returns:
+        dict: Mapping of each question to its answer and sources, or to None if it is not cached
+        """
+        keys = [self._compute_question_hash(question, self.namespace) for question in questions]
+        entries = self.backend.get_many(keys)
+        return {
+            question: {"answer": entry["answer"], "sources": entry["sources"]} if entry else None
+            for question, entry in zip(questions, entries)
+        }
 
     def cache_answer(self, question: str, answer: str, sources: Any):
         """
-        Cache an answer in the database.
+        Cache an answer in the backend.
 
         Args:
         question (str): The question being answered
         answer (str): The answer to the question
         sources (Any): The sources used to generate the answer
         """
-        question_hash = self._compute_question_hash(question)
-        
-        # Convert sources to a JSON-serializable format
-        if isinstance(sources, dict):
-            serializable_sources = list(sources.keys())  # Convert dict_keys to list
-        elif isinstance(sources, (list, tuple)):
-            serializable_sources = list(sources)
-        else:
-            serializable_sources = [str(sources)]  # Wrap single items in a list
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO qa_cache (question_hash, question, answer, sources) VALUES (?, ?, ?, ?)",
-                (question_hash, question, answer, json.dumps(serializable_sources))
-            )
-            conn.commit()
+        self.cache_answers({question: (answer, sources)})
+
+    def cache_answers(self, answers: Dict[str, tuple]):
+        """
+        Cache several answers with a single backend round trip.
+
+        Args:
+        answers (dict): Mapping of question to a tuple of answer and sources
+        """
+        entries = {}
+        for question, (answer, sources) in answers.items():
+            # Convert sources to a JSON-serializable format
+            if isinstance(sources, dict):
+                serializable_sources = list(sources.keys())  # Convert dict_keys to list
+            elif isinstance(sources, (list, tuple)):
+                serializable_sources = list(sources)
+            else:
+                serializable_sources = [str(sources)]  # Wrap single items in a list
+
+            entries[self._compute_question_hash(question, self.namespace)] = {
+                "question": question,
+                "answer": answer,
+                "sources": serializable_sources
+            }
+        if entries:
+            self.backend.set_many(entries)
 
     @staticmethod
-    def _compute_question_hash(question: str) -> str:
+    def _compute_question_hash(question: str, namespace: Optional[str] = None) -> str:
         """
         Compute a hash of the question to use as a cache key.
 
         Args:
         question (str): The question to hash
+        namespace (str): Optional namespace the question belongs to
 
         Returns:
-        str: MD5 hash of the lowercased question
+        str: MD5 hash of the lowercased question, prefixed by the namespace if any
         """
-        return hashlib.md5(question.lower().encode()).hexdigest()
\ No newline at end of file
+        key = question.lower() if namespace is None else f"{namespace}\x00{question.lower()}"
+        return hashlib.md5(key.encode()).hexdigest()
@@ -10,102 +10,332 @@ from langchain.retrievers import ContextualCompressionRetriever
 from langchain.retrievers.document_compressors import LLMChainExtractor
 from langchain.retrievers import EnsembleRetriever
 import logging
-from langchain_community.chat_models import ChatOpenAI
 from langchain_community.retrievers import BM25Retriever
+from langchain_community.retrievers.bm25 import default_preprocessing_func
 from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 
+from chunk_store import ChunkStoreRetriever
+from deadline import (
+    TieredChain,
+    TIER_FULL,
+    TIER_NO_COMPRESSION,
+    TIER_REDUCED_K,
+    TIER_BM25_ONLY,
+    TIER_RETRIEVAL_ONLY,
+)
+from multi_question import MultiQuestionAnswerer
+from pipeline import RETRIEVER_MMR, RETRIEVER_SECTION, SOLUTION_2
+from hedging import HedgedChatOpenAI
+from section_index import SectionRetriever
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class ChainManager:
-    def __init__(self, openai_api_key):
+    # OpenAI chat model used for compression and answer generation
+    MODEL_NAME = "gpt-3.5-turbo-0125"
+
+    # Number of documents retrieved by the reduced tiers of a TieredChain
+    REDUCED_K = 2
+
+    def __init__(self, openai_api_key, llm_cache=None, config=SOLUTION_2):
         """
         Initialize the ChainManager with the OpenAI API key.
 
         Args:
         openai_api_key (str): The OpenAI API key for authentication
+        llm_cache (LLMCache): Optional cache of individual LLM calls shared by all chains
+        config (PipelineConfig): Pipeline settings for the retriever, compression and prompts
         """
         self.openai_api_key = openai_api_key
+        self.llm_cache = llm_cache
+        self.config = config
 
-    def create_advanced_chain(self, vectorstore):
+    def create_advanced_chain(self, vectorstore, chunk_store=None, section_index=None):
         """
         Create an advanced question-answering chain.
 
-        This method sets up a complex retrieval system combining dense and sparse
-        retrievers, applies contextual compression, and uses custom prompts.
+        This method sets up the retriever selected by the pipeline config,
+        by default combining dense and sparse retrievers, optionally applies
+        contextual compression, and uses the config's prompts. With the
+        section retriever and a section index, retrieval first ranks sections
+        and then searches chunks only inside the top sections.
 
         Args:
         vectorstore: The vector store containing the document embeddings
+        chunk_store (ChunkStore): Optional memory-mapped chunk store the retrievers read texts and metadata from
+        section_index (SectionIndex): Optional section centroids enabling coarse-to-fine retrieval
 
         Returns:
         RetrievalQA: The question-answering chain, or None if an error occurs
         """
         try:
-            # Initialize the language model
-            llm = ChatOpenAI(model_name="gpt-3.5-turbo-0125", temperature=0.00001, openai_api_key=self.openai_api_key)
+            # Initialize the language model for answer generation
+            llm = self.create_llm("generator")
+            k = self.config.k
             
-            # Create dense retriever
-            dense_retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 5})
-            
-            # Create sparse retriever (BM25)
-            documents = self.prepare_documents(vectorstore.get())
-            bm25_retriever = BM25Retriever.from_documents(documents)
-            bm25_retriever.k = 5
+            if self.config.retriever == RETRIEVER_MMR:
+                base_retriever = self._create_dense_retriever(vectorstore, k=k, chunk_store=chunk_store)
+            else:
+                # Create ensemble of dense and sparse (BM25) retrievers
+                bm25_retriever = self.create_bm25_retriever(vectorstore, chunk_store=chunk_store)
+                if self.config.retriever == RETRIEVER_SECTION and section_index is not None:
+                    base_retriever = self._create_section_retriever(vectorstore, bm25_retriever, section_index, k=k,
+                                                                    chunk_store=chunk_store)
+                else:
+                    base_retriever = self._create_ensemble_retriever(vectorstore, bm25_retriever, k=k,
+                                                                     chunk_store=chunk_store)
             
-            # Create ensemble retriever
-            ensemble_retriever = EnsembleRetriever(
-                retrievers=[dense_retriever, bm25_retriever],
-                weights=[0.5, 0.5]
-            )
+            if not self.config.compression:
+                return self.create_qa_chain(llm, base_retriever)
             
             # Apply contextual compression
-            compressor = LLMChainExtractor.from_llm(llm)
+            compressor = LLMChainExtractor.from_llm(self.create_llm("compressor"))
             compression_retriever = ContextualCompressionRetriever(
                 base_compressor=compressor,
-                base_retriever=ensemble_retriever
-            )
-            
-            # Define custom prompts
-            context_prompt = PromptTemplate(
-                input_variables=["context", "question"],
-                template="Given the following context:\n\n{context}\n\nAnswer the following question: {question}\n\nIf the answer is not explicitly stated in the context, try to find keywords matching. Else, say 'Data Not Available'. Include the section number in your response when possible."
-            )
-            
-            document_prompt = PromptTemplate(
-                input_variables=["page_content", "section"],
-                template="[Section {section}] {page_content}"
+                base_retriever=base_retriever
             )
             
             # Create the QA chain
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=llm,
-                chain_type="stuff",
-                retriever=compression_retriever,
-                return_source_documents=True,
-                chain_type_kwargs={
-                    "prompt": context_prompt,
-                    "document_prompt": document_prompt,
-                }
-            )
-            
-            return qa_chain
+            return self.create_qa_chain(llm, compression_retriever)
         except Exception as e:
             logger.error(f"Error creating advanced chain: {e}")
             return None
 
+    def create_tiered_chain(self, vectorstore, scheduler=None, chunk_store=None, section_index=None):
+        """
+        Create a deadline-aware chain that can degrade to cheaper pipeline tiers.
+
+        The tiers are, from most to least complete: the full advanced chain,
+        the ensemble retriever without contextual compression, the ensemble
+        retriever with a reduced k, BM25-only retrieval, and a retrieval-only
+        excerpt that makes no LLM call.
+
+        Args:
+        vectorstore: The vector store containing the document embeddings
+        scheduler (DegradationScheduler): Scheduler used to pick tiers
+        chunk_store (ChunkStore): Optional memory-mapped chunk store the retrievers read texts and metadata from
+        section_index (SectionIndex): Optional section centroids used by the full tier
+
+        Returns:
+        TieredChain: The tiered question-answering chain, or None if an error occurs
+        """
+        try:
+            full_chain = self.create_advanced_chain(vectorstore, chunk_store=chunk_store, section_index=section_index)
+            if not full_chain:
+                raise ValueError("Failed to create the full chain")
+
+            llm = self.create_llm("generator")
+            bm25_retriever = self.create_bm25_retriever(vectorstore, chunk_store=chunk_store)
+            no_compression_chain = self.create_qa_chain(
+                llm, self._create_ensemble_retriever(vectorstore, bm25_retriever, k=self.config.k, chunk_store=chunk_store))
+            reduced_k_chain = self.create_qa_chain(
+                llm, self._create_ensemble_retriever(vectorstore, bm25_retriever, k=self.REDUCED_K, chunk_store=chunk_store))
+            bm25_only_retriever = self.with_k(bm25_retriever, self.REDUCED_K)
+            bm25_only_chain = self.create_qa_chain(llm, bm25_only_retriever)
+
+            tiers = {
+                TIER_FULL: lambda query: full_chain({"query": query}),
+                TIER_NO_COMPRESSION: lambda query: no_compression_chain({"query": query}),
+                TIER_REDUCED_K: lambda query: reduced_k_chain({"query": query}),
+                TIER_BM25_ONLY: lambda query: bm25_only_chain({"query": query}),
+                TIER_RETRIEVAL_ONLY: lambda query: self.retrieval_only_answer(bm25_only_retriever, query),
+            }
+            return TieredChain(tiers, scheduler=scheduler)
+        except Exception as e:
+            logger.error(f"Error creating tiered chain: {e}")
+            return None
+
+    def create_llm(self, call_site):
+        """
+        Create the chat model used for compression or answer generation.
+
+        Requests are admitted by the process-wide rate limiter, which also
+        handles retries, so the client's own retries are disabled. Slow
+        requests are hedged when hedging is enabled for the model.
+
+        Args:
+        call_site (str): Name of the call site, used for LLM cache statistics
+
+        Returns:
+        HedgedChatOpenAI: The language model
+        """
+        cache = self.llm_cache.for_call_site(call_site) if self.llm_cache else None
+        return HedgedChatOpenAI(model_name=self.MODEL_NAME, temperature=0.00001, openai_api_key=self.openai_api_key, cache=cache, max_retries=0)
+
+    def create_bm25_retriever(self, vectorstore, k=5, chunk_store=None):
+        """
+        Create a sparse (BM25) retriever over all documents in the vector store.
+
+        With a chunk store, the index statistics are persisted in the store and
+        the retriever keeps only chunk ids, filling in its results from the
+        store, instead of holding a copy of every chunk.
+
+        Args:
+        vectorstore: The vector store containing the document embeddings
+        k (int): Number of documents to retrieve
+        chunk_store (ChunkStore): Optional memory-mapped chunk store
+
+        Returns:
+        BaseRetriever: The sparse retriever
+        """
+        if chunk_store is None:
+            documents = self.prepare_documents(vectorstore.get())
+            bm25_retriever = BM25Retriever.from_documents(documents)
+            bm25_retriever.k = k
+            return bm25_retriever
+
+        vectorizer = chunk_store.bm25_index(default_preprocessing_func)
+        stubs = [Document(page_content="", metadata={"chunk_id": chunk_id}) for chunk_id in range(len(chunk_store))]
+        bm25_retriever = BM25Retriever(vectorizer=vectorizer, docs=stubs, k=k)
+        return ChunkStoreRetriever(base_retriever=bm25_retriever, store=chunk_store)
+
+    @staticmethod
+    def with_k(sparse_retriever, k):
+        """
+        Return a sparse retriever sharing the index of another but returning k documents.
+
+        Args:
+        sparse_retriever: A retriever created by create_bm25_retriever
+        k (int): Number of documents to retrieve
+
+        Returns:
+        BaseRetriever: The sparse retriever
+        """
+        if isinstance(sparse_retriever, ChunkStoreRetriever):
+            return sparse_retriever.copy(update={"base_retriever": ChainManager.with_k(sparse_retriever.base_retriever, k)})
+        if sparse_retriever.k == k:
+            return sparse_retriever
+        return sparse_retriever.copy(update={"k": k})
+
+    @staticmethod
+    def _create_dense_retriever(vectorstore, k=5, chunk_store=None):
+        """
+        Create a dense MMR retriever.
+
+        With a chunk store, hits are resolved through the store by chunk id,
+        so that dense and sparse hits carry the same texts and metadata.
+
+        Args:
+        vectorstore: The vector store containing the document embeddings
+        k (int): Number of documents to retrieve
+        chunk_store (ChunkStore): Optional memory-mapped chunk store
+
+        Returns:
+        BaseRetriever: The dense retriever
+        """
+        dense_retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": k})
+        if chunk_store is None:
+            return dense_retriever
+        return ChunkStoreRetriever(base_retriever=dense_retriever, store=chunk_store)
+
+    @staticmethod
+    def _create_ensemble_retriever(vectorstore, bm25_retriever, k=5, chunk_store=None):
+        """
+        Combine a dense MMR retriever with a sparse retriever.
+
+        Args:
+        vectorstore: The vector store containing the document embeddings
+        bm25_retriever: The sparse retriever
+        k (int): Number of documents each retriever returns
+        chunk_store (ChunkStore): Optional memory-mapped chunk store dense hits are resolved through
+
+        Returns:
+        EnsembleRetriever: The ensemble retriever
+        """
+        dense_retriever = ChainManager._create_dense_retriever(vectorstore, k=k, chunk_store=chunk_store)
+        return EnsembleRetriever(
+            retrievers=[dense_retriever, ChainManager.with_k(bm25_retriever, k)],
+            weights=[0.5, 0.5]
+        )
+
+    @staticmethod
+    def _create_section_retriever(vectorstore, bm25_retriever, section_index, k=5, chunk_store=None):
+        """
+        Create a two-stage retriever searching dense and sparse results inside the top-ranked sections.
+
+        Queries the sections do not serve well fall back to the flat ensemble.
+
+        Args:
+        vectorstore: The vector store containing the document embeddings
+        bm25_retriever: The sparse retriever
+        section_index (SectionIndex): The section centroids of the document
+        k (int): Number of documents returned
+        chunk_store (ChunkStore): Optional memory-mapped chunk store dense hits are resolved through
+
+        Returns:
+        SectionRetriever: The section retriever
+        """
+        fallback_retriever = ChainManager._create_ensemble_retriever(vectorstore, bm25_retriever, k=k, chunk_store=chunk_store)
+        retriever = SectionRetriever(vectorstore=vectorstore, section_index=section_index, k=k, chunk_store=chunk_store,
+                                     fallback_retriever=fallback_retriever)
+        # The sparse side is filtered to the top sections, so it must look beyond the first k hits
+        retriever.sparse_retriever = ChainManager.with_k(bm25_retriever, retriever.fetch_k)
+        return retriever
+
+    def create_qa_chain(self, llm, retriever):
+        """
+        Create a "stuff" RetrievalQA chain with the config's prompts.
+
+        Args:
+        llm: The language model generating the answer
+        retriever: The retriever supplying the context
+
+        Returns:
+        RetrievalQA: The question-answering chain
+        """
+        context_prompt = PromptTemplate.from_template(self.config.context_template)
+        document_prompt = PromptTemplate.from_template(self.config.document_template)
+        
+        return RetrievalQA.from_chain_type(
+            llm=llm,
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=True,
+            chain_type_kwargs={
+                "prompt": context_prompt,
+                "document_prompt": document_prompt,
+            }
+        )
+
+    @staticmethod
+    def retrieval_only_answer(retriever, query, max_chars=500):
+        """
+        Answer with an excerpt of the best retrieved document, without calling the LLM.
+
+        Args:
+        retriever: The retriever supplying the documents
+        query (str): The question to process
+        max_chars (int): Maximum length of the excerpt
+
+        Returns:
+        dict: A RetrievalQA-style response with ``result`` and ``source_documents``
+        """
+        documents = retriever.get_relevant_documents(query)
+        if not documents:
+            return {"result": "Data Not Available", "source_documents": []}
+        excerpt = documents[0].page_content.strip()
+        if len(excerpt) > max_chars:
+            excerpt = excerpt[:max_chars].rsplit(" ", 1)[0] + "..."
+        return {"result": excerpt, "source_documents": documents}
+
     @staticmethod
     def prepare_documents(docs):
         """
         Prepare documents for use in the BM25 retriever.
 
         Args:
-        docs: The documents to prepare
+        docs: The documents to prepare, or the dictionary returned by a Chroma ``get()``
 
         Returns:
         list: A list of prepared Document objects
         """
+        if isinstance(docs, dict):
+            # Chroma returns parallel lists of texts and metadata rather than Documents
+            return [Document(page_content=text, metadata=metadata or {})
+                    for text, metadata in zip(docs.get("documents") or [], docs.get("metadatas") or [])]
         prepared_docs = []
         for doc in docs:
             if isinstance(doc, Document):
@@ -117,20 +347,87 @@ class ChainManager:
         return prepared_docs
 
     @staticmethod
-    def process_query(chain, query):
+    def process_query(chain, query, budget=None):
         """
         Process a query using the QA chain.
 
         Args:
-        chain: The question-answering chain
+        chain: The question-answering chain, or a TieredChain
         query (str): The question to process
+        budget (float): Optional latency budget in seconds; only honoured by a TieredChain
 
         Returns:
-        tuple: A tuple containing the answer and source documents
+        tuple: A tuple containing the answer, the source documents and the tier used
         """
         try:
+            if isinstance(chain, TieredChain):
+                return chain.run(query, budget=budget)
+            if budget is not None:
+                logger.warning("Latency budget ignored: the chain is not deadline-aware")
             response = chain({"query": query})
-            return response['result'], response['source_documents']
+            return response['result'], response['source_documents'], TIER_FULL
+        except Exception as e:
+            logger.error(f"Error processing query: {e}")
+            return "An error occurred while processing the query.", [], None
+
+    @staticmethod
+    def answer_from_documents(chain, query, documents):
+        """
+        Answer a query with a QA chain over documents already retrieved by its base retriever.
+
+        The documents go through the chain's contextual compression, if any, so
+        the answer is the one process_query would give without retrieving again.
+
+        Args:
+        chain: The question-answering chain
+        query (str): The question to process
+        documents (list): The documents the chain's base retriever returns for the query
+
+        Returns:
+        tuple: A tuple containing the answer, the source documents and the tier used
+        """
+        try:
+            compressor = getattr(chain.retriever, "base_compressor", None)
+            if compressor is not None:
+                documents = list(compressor.compress_documents(documents, query))
+            answer = chain.combine_documents_chain.run(input_documents=documents, question=query)
+            return answer, documents, TIER_FULL
         except Exception as e:
             logger.error(f"Error processing query: {e}")
-            return "An error occurred while processing the query.", []
\ No newline at end of file
+            return "An error occurred while processing the query.", [], None
+
+    @staticmethod
+    def process_queries_batched(chain, queries, **kwargs):
+        """
+        Process several queries, answering those that share retrieved context in one LLM call.
+
+        Questions are grouped on the candidates of the chain's base retriever, and
+        each group is answered over the union of its uncompressed context, so
+        batched answers skip contextual compression as well. Singleton groups
+        and answers that cannot be attributed to their question are answered
+        alone from the candidates already retrieved; deadline-aware chains go
+        through process_query.
+
+        Args:
+        chain: The question-answering chain
+        queries (list): The questions to process
+        **kwargs: Options of MultiQuestionAnswerer, e.g. overlap_threshold or max_group_size
+
+        Returns:
+        dict: Mapping of query to a tuple of answer, source documents and tier
+        """
+        def fallback(query, documents=None):
+            if documents is None:
+                return ChainManager.process_query(chain, query)
+            return ChainManager.answer_from_documents(chain, query, documents)
+
+        if isinstance(chain, TieredChain) or len(queries) < 2:
+            return {query: fallback(query) for query in queries}
+        try:
+            retriever = getattr(chain.retriever, "base_retriever", chain.retriever)
+            stuff_chain = chain.combine_documents_chain
+            answerer = MultiQuestionAnswerer(retriever, stuff_chain.llm_chain.llm, stuff_chain.document_prompt, **kwargs)
+            return answerer.answer(queries, fallback)
+        except Exception as e:
+            logger.error(f"Error processing batched queries: {e}")
+            return {query: fallback(query) for query in queries}
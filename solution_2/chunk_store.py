@@ -0,0 +1,267 @@
+"""
+chunk_store.py: Compact, memory-mapped storage of chunk texts and metadata.
+
+This module writes the chunks of a document at ingestion time as one
+contiguous UTF-8 text buffer with an offsets array, plus fixed-width arrays
+for page number, section and source, and memory-maps them when the document
+is loaded. Retrievers and source formatting read texts and metadata straight
+from the mapped files instead of keeping per-chunk Python objects alive, and
+opening a store costs only a few system calls. The BM25 statistics of the
+chunks are persisted next to them on first use, so later loads do not
+tokenize every text again.
+"""
+
+import os
+import json
+import mmap
+import logging
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from rank_bm25 import BM25Okapi
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Array files of the store and their typecodes
+_ARRAYS = {
+    "offsets": "q",   # n + 1 byte offsets into texts.bin
+    "pages": "i",     # page number, -1 if unknown
+    "sections": "i",  # index into the "sections" table
+    "sources": "i",   # index into the "sources" table
+    "merged": "i",    # index into the "merged_pages" table, -1 if the chunk was not merged
+}
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk texts and metadata of one document.
+    """
+
+    TEXTS_FILE = "texts.bin"
+    TABLES_FILE = "tables.json"
+    BM25_FILE = "bm25.json"
+
+    def __init__(self, directory: str):
+        """
+        Open a chunk store written by ChunkStore.write.
+
+        Args:
+        directory (str): Directory holding the store files
+        """
+        self.directory = directory
+        with open(os.path.join(directory, self.TABLES_FILE), encoding="utf-8") as tables:
+            self.tables: Dict[str, List[str]] = json.load(tables)
+        self._maps: List[mmap.mmap] = []
+        self._texts = self._map(self.TEXTS_FILE, "B")
+        self._arrays = {name: self._map(f"{name}.bin", typecode) for name, typecode in _ARRAYS.items()}
+
+    @classmethod
+    def write(cls, directory: str, chunks: List[Document]) -> "ChunkStore":
+        """
+        Write chunks to a new store and open it.
+
+        Chunks are stored in list order, so the chunk id of a chunk is its
+        position in ``chunks``.
+
+        Args:
+        directory (str): Directory to write the store files to
+        chunks (List[Document]): The chunks to store
+
+        Returns:
+        ChunkStore: The opened store
+        """
+        os.makedirs(directory, exist_ok=True)
+        tables: Dict[str, List[str]] = {"sections": [], "sources": [], "merged_pages": []}
+        indexes: Dict[str, Dict[str, int]] = {name: {} for name in tables}
+
+        def intern(table: str, value: str) -> int:
+            if value not in indexes[table]:
+                indexes[table][value] = len(tables[table])
+                tables[table].append(value)
+            return indexes[table][value]
+
+        arrays = {name: array(typecode) for name, typecode in _ARRAYS.items()}
+        arrays["offsets"].append(0)
+        with open(os.path.join(directory, cls.TEXTS_FILE), "wb") as texts:
+            offset = 0
+            for chunk in chunks:
+                encoded = chunk.page_content.encode("utf-8")
+                texts.write(encoded)
+                offset += len(encoded)
+                arrays["offsets"].append(offset)
+                page = chunk.metadata.get("page", "N/A")
+                arrays["pages"].append(page if isinstance(page, int) else -1)
+                arrays["sections"].append(intern("sections", str(chunk.metadata.get("section", "N/A"))))
+                arrays["sources"].append(intern("sources", str(chunk.metadata.get("source", "N/A"))))
+                pages = str(chunk.metadata.get("pages", ""))
+                arrays["merged"].append(intern("merged_pages", pages) if "," in pages else -1)
+
+        for name, values in arrays.items():
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as array_file:
+                values.tofile(array_file)
+        # Written last: a store without its tables is treated as missing
+        with open(os.path.join(directory, cls.TABLES_FILE), "w", encoding="utf-8") as tables_file:
+            json.dump(tables, tables_file)
+        return cls(directory)
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["ChunkStore"]:
+        """
+        Open the store in a directory, if there is one.
+
+        Args:
+        directory (str): Directory holding the store files
+
+        Returns:
+        ChunkStore or None: The store, or None if it is missing or unreadable
+        """
+        if not os.path.exists(os.path.join(directory, cls.TABLES_FILE)):
+            return None
+        try:
+            return cls(directory)
+        except Exception as e:
+            logger.error(f"Error opening chunk store in '{directory}': {e}")
+            return None
+
+    def __len__(self) -> int:
+        return max(0, len(self._arrays["offsets"]) - 1)
+
+    @property
+    def text_bytes(self) -> int:
+        """Total size of the stored texts, in bytes."""
+        return len(self._texts)
+
+    def text_view(self, chunk_id: int) -> memoryview:
+        """
+        Return the UTF-8 bytes of a chunk without copying them.
+
+        Args:
+        chunk_id (int): The chunk id
+
+        Returns:
+        memoryview: View into the mapped text buffer
+        """
+        offsets = self._arrays["offsets"]
+        return self._texts[offsets[chunk_id]:offsets[chunk_id + 1]]
+
+    def text(self, chunk_id: int) -> str:
+        """Return the text of a chunk."""
+        return str(self.text_view(chunk_id), "utf-8")
+
+    def metadata(self, chunk_id: int) -> Dict[str, object]:
+        """
+        Return the metadata of a chunk, in the same form as at ingestion.
+
+        Args:
+        chunk_id (int): The chunk id
+
+        Returns:
+        dict: The chunk id, page, section, source and, for merged chunks, pages
+        """
+        page = self._arrays["pages"][chunk_id]
+        metadata = {
+            "chunk_id": chunk_id,
+            "page": page if page >= 0 else "N/A",
+            "section": self.tables["sections"][self._arrays["sections"][chunk_id]],
+            "source": self.tables["sources"][self._arrays["sources"][chunk_id]],
+        }
+        merged = self._arrays["merged"][chunk_id]
+        metadata["pages"] = self.tables["merged_pages"][merged] if merged >= 0 else str(metadata["page"])
+        return metadata
+
+    def document(self, chunk_id: int) -> Document:
+        """Build the Document of a chunk."""
+        return Document(page_content=self.text(chunk_id), metadata=self.metadata(chunk_id))
+
+    def iter_texts(self):
+        """Yield the text of every chunk in chunk id order."""
+        for chunk_id in range(len(self)):
+            yield self.text(chunk_id)
+
+    def bm25_index(self, tokenize: Callable[[str], List[str]]) -> BM25Okapi:
+        """
+        Return the BM25 index of the chunks, in chunk id order.
+
+        The index statistics are read from the store if they were persisted,
+        and otherwise computed from the mapped texts and persisted.
+
+        Args:
+        tokenize (Callable): Splits a text into terms; must be the one queries are tokenized with
+
+        Returns:
+        BM25Okapi: The BM25 index
+        """
+        path = os.path.join(self.directory, self.BM25_FILE)
+        try:
+            with open(path, encoding="utf-8") as bm25_file:
+                values = json.load(bm25_file)
+            if len(values["doc_len"]) == len(self):
+                vectorizer = BM25Okapi.__new__(BM25Okapi)
+                vectorizer.__dict__.update(values, corpus_size=len(self), tokenizer=None)
+                return vectorizer
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable BM25 statistics in '{self.directory}': {e}")
+
+        vectorizer = BM25Okapi([tokenize(text) for text in self.iter_texts()])
+        values = {name: getattr(vectorizer, name) for name in ("k1", "b", "epsilon", "avgdl", "doc_len", "doc_freqs", "idf")}
+        try:
+            # Written to a temporary file first, so that a concurrent reader never sees a partial file
+            with open(f"{path}.tmp", "w", encoding="utf-8") as bm25_file:
+                json.dump(values, bm25_file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not persist BM25 statistics in '{self.directory}': {e}")
+        return vectorizer
+
+    def close(self):
+        """Release the memory maps, unless views returned by text_view are still alive."""
+        try:
+            self._texts.release()
+            for view in self._arrays.values():
+                view.release()
+            for mapped in self._maps:
+                mapped.close()
+            self._maps = []
+        except BufferError as e:
+            logger.warning(f"Chunk store in '{self.directory}' is still in use and was not closed: {e}")
+
+    def _map(self, file_name: str, typecode: str) -> memoryview:
+        """
+        Memory-map one store file as a typed view.
+
+        Args:
+        file_name (str): Name of the file in the store directory
+        typecode (str): struct typecode of the file's items
+
+        Returns:
+        memoryview: Read-only typed view of the file
+        """
+        path = os.path.join(self.directory, file_name)
+        if os.path.getsize(path) == 0:
+            # mmap cannot map empty files
+            return memoryview(b"").cast(typecode)
+        with open(path, "rb") as mapped_file:
+            mapped = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+
+class ChunkStoreRetriever(BaseRetriever):
+    """
+    Wraps a retriever whose documents only carry a chunk id, filling in text and metadata from a ChunkStore.
+    """
+
+    base_retriever: BaseRetriever
+    store: ChunkStore
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """Retrieve documents from the base retriever and hydrate them from the store."""
+        documents = self.base_retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
+        return [self.store.document(document.metadata["chunk_id"]) for document in documents]
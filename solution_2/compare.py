@@ -0,0 +1,156 @@
+"""
+compare.py: Side-by-side latency and token usage of pipeline presets.
+
+This script runs several pipeline configs over the same PDF and questions and
+reports, per config, the indexing time, the per-question latency and the
+OpenAI token usage and cost of answering. Answer and LLM caches are bypassed
+so that every config pays for its own calls.
+
+Usage:
+    python compare.py data/handbook.pdf --presets solution_1 solution_2 solution_2_sections
+    python compare.py data/handbook.pdf --config no_compression.json --output comparison.json
+"""
+
+import json
+import time
+import logging
+import argparse
+import statistics
+from typing import Any, Dict, List, Optional
+
+from langchain_community.callbacks.manager import get_openai_callback
+
+from pdf_extractor import PDFExtractor
+from chain import ChainManager
+from pipeline import PRESETS, PipelineConfig, get_preset, load_config
+from main import OPENAI_API_KEY, DEFAULT_QUESTIONS, build_qa_chain, format_source
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def run_config(config: PipelineConfig, pdf_path: str, questions: List[str]) -> Dict[str, Any]:
+    """
+    Build the pipeline of a config and answer every question with it.
+
+    Args:
+    config (PipelineConfig): The pipeline settings
+    pdf_path (str): Path to the PDF file
+    questions (List[str]): The questions to answer
+
+    Returns:
+    dict: The report of the config: timings in seconds, token usage and answers
+    """
+    pdf_extractor = PDFExtractor(config=config)
+    chain_manager = ChainManager(OPENAI_API_KEY, config=config)
+
+    start = time.perf_counter()
+    qa_chain = build_qa_chain(pdf_path, pdf_extractor, chain_manager)
+    index_seconds = time.perf_counter() - start
+
+    latencies = []
+    answers = {}
+    with get_openai_callback() as usage:
+        for question in questions:
+            start = time.perf_counter()
+            answer, sources, _ = ChainManager.process_query(qa_chain, question)
+            latencies.append(time.perf_counter() - start)
+            answers[question] = {
+                "answer": answer,
+                "sources": [format_source(doc, config.tag_sections) for doc in sources[:10]]
+            }
+
+    return {
+        "config": config.name,
+        "index_seconds": index_seconds,
+        "latency_mean": statistics.mean(latencies) if latencies else 0.0,
+        "latency_p50": statistics.median(latencies) if latencies else 0.0,
+        "latency_max": max(latencies, default=0.0),
+        "latency_total": sum(latencies),
+        "llm_requests": usage.successful_requests,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cost_usd": usage.total_cost,
+        "answers": answers,
+    }
+
+
+def compare_configs(configs: List[PipelineConfig], pdf_path: str, questions: List[str]) -> List[Dict[str, Any]]:
+    """
+    Run several configs over the same PDF and questions.
+
+    Args:
+    configs (List[PipelineConfig]): The pipeline settings to compare
+    pdf_path (str): Path to the PDF file
+    questions (List[str]): The questions to answer
+
+    Returns:
+    list: One report per config that ran; configs that failed are logged and skipped
+    """
+    reports = []
+    for config in configs:
+        logger.info(f"Running config '{config.name}'")
+        try:
+            reports.append(run_config(config, pdf_path, questions))
+        except Exception as e:
+            logger.error(f"Error running config '{config.name}': {e}")
+    return reports
+
+
+def format_table(reports: List[Dict[str, Any]]) -> str:
+    """
+    Format reports as a plain-text table.
+
+    Args:
+    reports (list): Reports returned by compare_configs
+
+    Returns:
+    str: The table
+    """
+    columns = [
+        ("config", "{}"), ("index_seconds", "{:.2f}"), ("latency_mean", "{:.2f}"), ("latency_p50", "{:.2f}"),
+        ("latency_max", "{:.2f}"), ("llm_requests", "{}"), ("total_tokens", "{}"), ("cost_usd", "{:.4f}"),
+    ]
+    rows = [[name for name, _ in columns]]
+    rows += [[template.format(report[name]) for name, template in columns] for report in reports]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parse command-line arguments and run the comparison.
+
+    Args:
+    argv (list): Command-line arguments, defaults to sys.argv
+
+    Returns:
+    int: Process exit code
+    """
+    parser = argparse.ArgumentParser(description="Compare latency and token usage of pipeline configs.")
+    parser.add_argument("pdf", help="PDF file to answer questions about")
+    parser.add_argument("--presets", nargs="*", default=None, help=f"Presets to run (default: all of {', '.join(PRESETS)})")
+    parser.add_argument("--config", nargs="*", default=[], help="JSON config files to run as well")
+    parser.add_argument("--questions", help="File with one question per line (default: the standard question set)")
+    parser.add_argument("--output", help="Write the full reports, including answers, to this JSON file")
+    args = parser.parse_args(argv)
+
+    presets = args.presets if args.presets is not None else ([] if args.config else list(PRESETS))
+    configs = [get_preset(name) for name in presets] + [load_config(path) for path in args.config]
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as questions_file:
+            questions = [line.strip() for line in questions_file if line.strip()]
+
+    reports = compare_configs(configs, args.pdf, questions)
+    print(format_table(reports))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(reports, output, indent=2)
+    return 0 if len(reports) == len(configs) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,436 @@
+"""
+corpus.py: Serves questions over many indexed PDFs from one process.
+
+This module keeps a registry of every indexed document with its tags, and a
+bounded least-recently-used set of open vector stores and BM25 indexes. Open
+documents are evicted once their estimated memory use exceeds a budget, so
+memory stays bounded however many PDFs are indexed: on Chroma versions whose
+process-wide system registry is known, evicting a document also stops the
+Chroma system behind its persist directory. Retrieval can span any tagged
+subset of documents and be filtered on chunk metadata.
+"""
+
+import gc
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import chromadb
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from chain import ChainManager
+from pdf_extractor import PDFExtractor
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Dimension of the text-embedding-ada-002 vectors held by an open vector store
+EMBEDDING_DIMENSIONS = 1536
+
+# Chroma versions whose process-wide system registry _release_chroma_system knows how to clear
+CHROMA_RELEASE_VERSIONS = ("0.4.", "0.5.")
+
+
+def _release_chroma_system(vectorstore) -> bool:
+    """
+    Stop the Chroma system behind a vector store and drop it from Chroma's registry.
+
+    Chroma keeps one system per persist directory in a process-wide registry
+    for as long as the process lives, so dropping a vector store alone frees
+    nothing. There is no public API to release one system, so this relies on
+    Chroma internals and only runs on the versions listed in CHROMA_RELEASE_VERSIONS;
+    on other versions nothing is released. Any other vector store open on the
+    same persist directory stops working.
+
+    Args:
+    vectorstore: The LangChain Chroma vector store
+
+    Returns:
+    bool: True if a system was released
+    """
+    if not chromadb.__version__.startswith(CHROMA_RELEASE_VERSIONS):
+        return False
+    from chromadb.api.client import SharedSystemClient
+    identifier = getattr(getattr(vectorstore, "_client", None), "_identifier", None)
+    registry = getattr(SharedSystemClient, "_identifier_to_system", None)
+    if identifier is None or not isinstance(registry, dict):
+        return False
+    system = registry.pop(identifier, None)
+    if system is None:
+        return False
+    system.stop()
+    return True
+
+
+class OpenDocument:
+    """
+    The in-memory indexes of one document.
+    """
+
+    def __init__(self, doc_id: str, vectorstore, bm25_retriever, chunk_count: int, text_bytes: int, chunk_store=None):
+        """
+        Initialize the OpenDocument.
+
+        Args:
+        doc_id (str): The document id
+        vectorstore: The document's Chroma vector store
+        bm25_retriever: The document's sparse index
+        chunk_count (int): Number of indexed chunks
+        text_bytes (int): Total size of the chunk texts
+        chunk_store (ChunkStore): The memory-mapped chunk store texts are read from, if the document has one
+        """
+        self.doc_id = doc_id
+        self.vectorstore = vectorstore
+        self.bm25_retriever = bm25_retriever
+        self.chunk_count = chunk_count
+        self.text_bytes = text_bytes
+        self.chunk_store = chunk_store
+        # BM25 keeps a tokenized copy of the texts; without a chunk store it also keeps the texts themselves
+        text_copies = 1 if chunk_store is not None else 3
+        self.memory_bytes = text_copies * text_bytes + chunk_count * EMBEDDING_DIMENSIONS * 4
+
+
+class CorpusManager:
+    """
+    Tracks indexed documents and keeps a memory-bounded LRU of open indexes.
+    """
+
+    def __init__(self, pdf_extractor: PDFExtractor, chain_manager: ChainManager, registry_path: str = 'corpus.db',
+                 max_memory_bytes: int = 512 * 1024 * 1024, release_evicted_stores: bool = True):
+        """
+        Initialize the CorpusManager.
+
+        Args:
+        pdf_extractor (PDFExtractor): Extractor used to index and open documents
+        chain_manager (ChainManager): Manager used to build sparse indexes and chains
+        registry_path (str): Path to the SQLite registry of indexed documents
+        max_memory_bytes (int): Memory budget of the open indexes
+        release_evicted_stores (bool): Stop the Chroma systems of evicted documents; turn this off when
+            other code in the process keeps vector stores of the same documents open
+        """
+        self.pdf_extractor = pdf_extractor
+        self.chain_manager = chain_manager
+        self.registry_path = registry_path
+        self.max_memory_bytes = max_memory_bytes
+        self.release_evicted_stores = release_evicted_stores
+        self._open: "OrderedDict[str, OpenDocument]" = OrderedDict()
+        # Documents in use by a running query, which eviction skips
+        self._pinned: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite registry with the required table."""
+        with sqlite3.connect(self.registry_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                pdf_path TEXT,
+                tags TEXT,
+                chunk_count INTEGER,
+                text_bytes INTEGER,
+                indexed_at REAL
+            )
+            ''')
+            conn.commit()
+
+    def index_document(self, pdf_path: str, tags: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Index a PDF, or load its existing index, and register it in the corpus.
+
+        Args:
+        pdf_path (str): Path to the PDF file
+        tags (List[str]): Tags used to select the document at query time
+
+        Returns:
+        str or None: The document id, or None if indexing failed
+        """
+        doc_id = PDFExtractor.get_pdf_id(pdf_path)
+        try:
+            vectorstore = self.pdf_extractor.open_vectorstore(pdf_path)
+            if vectorstore is None:
+                pages = self.pdf_extractor.get_pdf_text(pdf_path)
+                text_chunks = self.pdf_extractor.get_text_chunks(pages)
+                if not text_chunks:
+                    raise ValueError("Failed to create text chunks")
+                vectorstore = self.pdf_extractor.get_vectorstore(text_chunks, pdf_path)
+                if vectorstore is None:
+                    raise ValueError("Failed to create vector store")
+
+            document = self._cache(doc_id, vectorstore, self.pdf_extractor.get_chunk_store(pdf_path))
+            with sqlite3.connect(self.registry_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_id, pdf_path, tags, chunk_count, text_bytes, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, pdf_path, json.dumps(sorted(set(tags or []))), document.chunk_count,
+                     document.text_bytes, time.time())
+                )
+                conn.commit()
+            return doc_id
+        except Exception as e:
+            logger.error(f"Error indexing document '{pdf_path}': {e}")
+            return None
+
+    def list_documents(self, tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        List registered documents, optionally only those carrying all the given tags.
+
+        Args:
+        tags (List[str]): Tags every returned document must carry
+
+        Returns:
+        list: Registry entries with "doc_id", "pdf_path", "tags" and "chunk_count" keys
+        """
+        with sqlite3.connect(self.registry_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT doc_id, pdf_path, tags, chunk_count FROM documents ORDER BY doc_id")
+            rows = cursor.fetchall()
+        entries = [{"doc_id": row[0], "pdf_path": row[1], "tags": json.loads(row[2]), "chunk_count": row[3]} for row in rows]
+        if tags:
+            entries = [entry for entry in entries if set(tags) <= set(entry["tags"])]
+        return entries
+
+    def open_document(self, doc_id: str) -> OpenDocument:
+        """
+        Return the open indexes of a document, loading them if needed.
+
+        Args:
+        doc_id (str): The document id
+
+        Returns:
+        OpenDocument: The document's vector store and sparse index
+
+        Raises:
+        KeyError: If the document is not registered
+        """
+        with self._lock:
+            if doc_id in self._open:
+                self._open.move_to_end(doc_id)
+                return self._open[doc_id]
+
+        with sqlite3.connect(self.registry_path) as conn:
+            row = conn.execute("SELECT pdf_path FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Document '{doc_id}' is not indexed")
+        vectorstore = self.pdf_extractor.open_vectorstore(row[0])
+        if vectorstore is None:
+            raise KeyError(f"Vector store of document '{doc_id}' is missing")
+        return self._cache(doc_id, vectorstore, self.pdf_extractor.get_chunk_store(row[0]))
+
+    def retrieve(self, query: str, tags: Optional[List[str]] = None, doc_ids: Optional[List[str]] = None,
+                 where: Optional[Dict[str, Any]] = None, k: int = 5) -> List[Document]:
+        """
+        Retrieve chunks across documents, fusing dense and sparse rankings.
+
+        Dense results are ranked globally by embedding distance, which is
+        comparable across documents sharing one embedding model. BM25 scores
+        are not, so sparse results are ranked within each document and both
+        rankings are combined with reciprocal rank fusion. The query is
+        embedded once, and documents are opened one at a time, so the open
+        indexes stay within the memory budget however many documents are searched.
+
+        Args:
+        query (str): The query
+        tags (List[str]): Only search documents carrying all these tags
+        doc_ids (List[str]): Only search these documents
+        where (dict): Chunk metadata equality filter, e.g. {"section": "2.1", "page": 3}
+        k (int): Number of chunks to return
+
+        Returns:
+        List[Document]: The chunks, each with a "doc_id" metadata entry
+        """
+        targets = [entry["doc_id"] for entry in self.list_documents(tags)]
+        if doc_ids is not None:
+            targets = [doc_id for doc_id in targets if doc_id in set(doc_ids)]
+
+        dense: List[tuple] = []
+        sparse: List[tuple] = []
+        if not targets:
+            return []
+        embedding = self.pdf_extractor.openai_ef.embed_query(query)
+        for doc_id in targets:
+            try:
+                # Pinned only while it is searched; the results are copies and outlive it
+                with self._pin([doc_id]):
+                    document = self.open_document(doc_id)
+                    for chunk, distance in document.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                            embedding, k=k, filter=self._chroma_filter(where)):
+                        if document.chunk_store is not None:
+                            chunk = document.chunk_store.document(chunk.metadata["chunk_id"])
+                        dense.append((distance, self._tag(chunk, doc_id)))
+                    # With a filter, rank every chunk so that matching ones are not cut off before filtering
+                    fetch_k = document.chunk_count if where else k
+                    sparse_retriever = ChainManager.with_k(document.bm25_retriever, max(1, fetch_k))
+                    sparse_chunks = [chunk for chunk in sparse_retriever.get_relevant_documents(query)
+                                     if self._matches(chunk, where)]
+                    for rank, chunk in enumerate(sparse_chunks[:k]):
+                        sparse.append((rank, self._tag(chunk, doc_id)))
+            except Exception as e:
+                logger.error(f"Error retrieving from document '{doc_id}': {e}")
+
+        # Reciprocal rank fusion with equal weights, as in the single-document ensemble
+        scores: Dict[tuple, float] = {}
+        chunks: Dict[tuple, Document] = {}
+        for rank, (_, chunk) in enumerate(sorted(dense, key=lambda item: item[0])):
+            key = (chunk.metadata["doc_id"], chunk.page_content)
+            scores[key] = scores.get(key, 0.0) + 0.5 / (60 + rank)
+            chunks[key] = chunk
+        for rank, (_, chunk) in enumerate(sorted(sparse, key=lambda item: item[0])):
+            key = (chunk.metadata["doc_id"], chunk.page_content)
+            scores[key] = scores.get(key, 0.0) + 0.5 / (60 + rank)
+            chunks.setdefault(key, chunk)
+        ranked = sorted(scores, key=lambda key: -scores[key])
+        return [chunks[key] for key in ranked[:k]]
+
+    def create_chain(self, tags: Optional[List[str]] = None, doc_ids: Optional[List[str]] = None,
+                     where: Optional[Dict[str, Any]] = None, k: int = 5):
+        """
+        Create a question-answering chain over a subset of the corpus.
+
+        Args:
+        tags (List[str]): Only search documents carrying all these tags
+        doc_ids (List[str]): Only search these documents
+        where (dict): Chunk metadata equality filter
+        k (int): Number of chunks used as context
+
+        Returns:
+        RetrievalQA: The question-answering chain, or None if an error occurs
+        """
+        try:
+            retriever = CorpusRetriever(corpus=self, tags=tags, doc_ids=doc_ids, where=where, k=k)
+            return self.chain_manager.create_qa_chain(self.chain_manager.create_llm("generator"), retriever)
+        except Exception as e:
+            logger.error(f"Error creating corpus chain: {e}")
+            return None
+
+    def memory_usage(self) -> int:
+        """Return the estimated memory held by the open indexes, in bytes."""
+        with self._lock:
+            return sum(document.memory_bytes for document in self._open.values())
+
+    def _cache(self, doc_id: str, vectorstore, chunk_store=None) -> OpenDocument:
+        """
+        Add a document's indexes to the LRU and evict the least recently used beyond the budget.
+
+        Args:
+        doc_id (str): The document id
+        vectorstore: The document's vector store
+        chunk_store (ChunkStore): The document's chunk store, if it has one
+
+        Returns:
+        OpenDocument: The cached indexes
+        """
+        bm25_retriever = self.chain_manager.create_bm25_retriever(vectorstore, chunk_store=chunk_store)
+        if chunk_store is not None:
+            document = OpenDocument(doc_id, vectorstore, bm25_retriever, len(chunk_store), chunk_store.text_bytes, chunk_store)
+        else:
+            texts = [chunk.page_content for chunk in bm25_retriever.docs]
+            document = OpenDocument(doc_id, vectorstore, bm25_retriever, len(texts),
+                                    sum(len(text.encode()) for text in texts))
+
+        with self._lock:
+            # A reindexed document shares its Chroma system with the entry it replaces, so that is not closed
+            self._open.pop(doc_id, None)
+            self._open[doc_id] = document
+        self._evict(keep=doc_id)
+        return document
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        Close least recently used documents until the open indexes fit the budget.
+
+        The most recently used document, pinned documents and ``keep`` are
+        never evicted.
+
+        Args:
+        keep (str): A document id that must stay open
+        """
+        evicted = []
+        with self._lock:
+            while len(self._open) > 1 and self.memory_usage() > self.max_memory_bytes:
+                candidates = [doc_id for doc_id in self._open if doc_id != keep and doc_id not in self._pinned]
+                if not candidates:
+                    break
+                evicted.append(self._open.pop(candidates[0]))
+        for document in evicted:
+            self._close(document)
+            logger.info(f"Evicted document '{document.doc_id}' from the open index cache")
+        if evicted:
+            gc.collect()
+
+    @contextmanager
+    def _pin(self, doc_ids: List[str]):
+        """
+        Keep documents from being evicted while the block uses them.
+
+        Args:
+        doc_ids (List[str]): The documents in use
+        """
+        with self._lock:
+            for doc_id in doc_ids:
+                self._pinned[doc_id] = self._pinned.get(doc_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for doc_id in doc_ids:
+                    self._pinned[doc_id] -= 1
+                    if not self._pinned[doc_id]:
+                        del self._pinned[doc_id]
+            self._evict()
+
+    def _close(self, document: OpenDocument):
+        """
+        Release what an evicted document holds outside the LRU.
+
+        Args:
+        document (OpenDocument): The evicted document
+        """
+        if not self.release_evicted_stores:
+            return
+        try:
+            if not _release_chroma_system(document.vectorstore):
+                logger.debug(f"No Chroma system released for document '{document.doc_id}'")
+        except Exception as e:
+            logger.error(f"Error closing the vector store of document '{document.doc_id}': {e}")
+
+    @staticmethod
+    def _tag(chunk: Document, doc_id: str) -> Document:
+        """Return a copy of a chunk whose metadata records the document it came from."""
+        return Document(page_content=chunk.page_content, metadata=dict(chunk.metadata, doc_id=doc_id))
+
+    @staticmethod
+    def _chroma_filter(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Translate an equality filter to Chroma's syntax, which needs $and for several keys."""
+        if not where or len(where) == 1:
+            return where or None
+        return {"$and": [{key: value} for key, value in where.items()]}
+
+    @staticmethod
+    def _matches(chunk: Document, where: Optional[Dict[str, Any]]) -> bool:
+        """Check a chunk's metadata against an equality filter."""
+        return not where or all(chunk.metadata.get(key) == value for key, value in where.items())
+
+
+class CorpusRetriever(BaseRetriever):
+    """
+    A LangChain retriever over a subset of a CorpusManager's documents.
+    """
+
+    corpus: Any
+    tags: Optional[List[str]] = None
+    doc_ids: Optional[List[str]] = None
+    where: Optional[Dict[str, Any]] = None
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """Retrieve chunks for a query from the selected documents."""
+        return self.corpus.retrieve(query, tags=self.tags, doc_ids=self.doc_ids, where=self.where, k=self.k)
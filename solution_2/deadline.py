@@ -0,0 +1,316 @@
+"""
+deadline.py: Deadline-aware execution of the question-answering pipeline.
+
+This module provides a per-question latency budget and a scheduler that
+downgrades the pipeline through progressively cheaper tiers as the deadline
+approaches, so that callers with tight latency requirements always get an answer.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Tuple
+
+from profiling import propagate
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tiers ordered from the most complete (and slowest) to the cheapest
+TIER_FULL = "full"
+TIER_NO_COMPRESSION = "no_compression"
+TIER_REDUCED_K = "reduced_k"
+TIER_BM25_ONLY = "bm25_only"
+TIER_RETRIEVAL_ONLY = "retrieval_only"
+
+TIERS = (TIER_FULL, TIER_NO_COMPRESSION, TIER_REDUCED_K, TIER_BM25_ONLY, TIER_RETRIEVAL_ONLY)
+
+
+class Deadline:
+    """
+    A latency budget measured against a monotonic clock.
+    """
+
+    def __init__(self, budget: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the Deadline.
+
+        Args:
+        budget (float): The latency budget in seconds
+        clock (Callable): Monotonic clock returning seconds
+        """
+        self.budget = budget
+        self.clock = clock
+        self.start = clock()
+
+    def elapsed(self) -> float:
+        """Return the number of seconds spent since the deadline was created."""
+        return self.clock() - self.start
+
+    def remaining(self) -> float:
+        """Return the number of seconds left before the deadline, never negative."""
+        return max(0.0, self.budget - self.elapsed())
+
+    def expired(self) -> bool:
+        """Return True if the budget has been used up."""
+        return self.remaining() <= 0.0
+
+
+class DegradationScheduler:
+    """
+    Chooses a pipeline tier from observed per-tier latencies and the remaining budget.
+    """
+
+    # Initial latency estimates (seconds) used until real observations arrive
+    DEFAULT_ESTIMATES = {
+        TIER_FULL: 8.0,
+        TIER_NO_COMPRESSION: 3.0,
+        TIER_REDUCED_K: 2.0,
+        TIER_BM25_ONLY: 1.5,
+        TIER_RETRIEVAL_ONLY: 0.05,
+    }
+
+    def __init__(self, estimates: Optional[Dict[str, float]] = None, alpha: float = 0.3, safety_margin: float = 1.2,
+                 probe_every: int = 20, max_probe_ratio: float = 3.0):
+        """
+        Initialize the DegradationScheduler.
+
+        Args:
+        estimates (dict): Initial latency estimates per tier, in seconds
+        alpha (float): Smoothing factor of the exponentially weighted moving average
+        safety_margin (float): Multiplier applied to an estimate before comparing it with the remaining budget
+        probe_every (int): Every this many degraded choices, try the next more complete tier instead
+        max_probe_ratio (float): Never probe a tier whose estimate is more than this many times the remaining budget
+        """
+        self.estimates = dict(self.DEFAULT_ESTIMATES)
+        if estimates:
+            self.estimates.update(estimates)
+        self.alpha = alpha
+        self.safety_margin = safety_margin
+        self.probe_every = probe_every
+        self.max_probe_ratio = max_probe_ratio
+        self._probed = set()
+        self._recorded = set()
+        self._degraded_choices = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, tier: str) -> float:
+        """
+        Return the current latency estimate for a tier.
+
+        Args:
+        tier (str): The tier name
+
+        Returns:
+        float: Estimated latency in seconds
+        """
+        with self._lock:
+            return self.estimates[tier]
+
+    def choose(self, remaining: float, tiers: Tuple[str, ...] = TIERS) -> str:
+        """
+        Pick the most complete tier expected to finish within the remaining budget.
+
+        An estimate only changes when its tier runs, so a tier ruled out by a
+        pessimistic estimate would never be tried again. When a more complete
+        tier is ruled out, it is therefore probed instead if it has never been
+        tried, and otherwise once every probe_every such choices. Tiers expected
+        to take far longer than the remaining budget are not probed, since the
+        probe would only cost the query its answer.
+
+        Args:
+        remaining (float): Seconds left before the deadline
+        tiers (tuple): Candidate tiers, ordered from most to least complete
+
+        Returns:
+        str: The selected tier; the cheapest candidate if none is expected to fit
+        """
+        index = next((index for index, tier in enumerate(tiers)
+                      if self.estimate(tier) * self.safety_margin <= remaining), len(tiers) - 1)
+        if index == 0:
+            return tiers[0]
+        skipped = tiers[index - 1]
+        if self.estimate(skipped) > remaining * self.max_probe_ratio:
+            return tiers[index]
+        with self._lock:
+            self._degraded_choices += 1
+            probe = skipped not in self._probed or self._degraded_choices % self.probe_every == 0
+            # Concurrent queries should not all probe the same tier
+            self._probed.add(skipped)
+        if probe and remaining > self.estimate(TIERS[-1]) * self.safety_margin:
+            logger.info(f"Probing tier '{skipped}' (estimated {self.estimate(skipped):.2f}s, {remaining:.2f}s left)")
+            return skipped
+        return tiers[index]
+
+    def record(self, tier: str, elapsed: float):
+        """
+        Fold an observed latency into the tier's estimate.
+
+        The first observation of a tier replaces its initial estimate outright.
+
+        Args:
+        tier (str): The tier that was executed
+        elapsed (float): Observed latency in seconds
+        """
+        with self._lock:
+            if tier not in self._recorded:
+                self.estimates[tier] = elapsed
+            else:
+                self.estimates[tier] = (1 - self.alpha) * self.estimates[tier] + self.alpha * elapsed
+            self._recorded.add(tier)
+            self._probed.add(tier)
+
+    def record_timeout(self, tier: str, elapsed: float):
+        """
+        Raise a tier's estimate to the time a call was given before it was abandoned.
+
+        The abandoned call's real latency is recorded when it completes; until
+        then, the time it was given is a lower bound of it.
+
+        Args:
+        tier (str): The tier that missed the deadline
+        elapsed (float): Seconds the call ran before it was abandoned
+        """
+        with self._lock:
+            self.estimates[tier] = max(self.estimates[tier], elapsed)
+            self._probed.add(tier)
+
+
+class TieredChain:
+    """
+    A set of question-answering callables, one per tier, run under a deadline.
+
+    Each tier callable takes the query and returns a dictionary with ``result``
+    and ``source_documents`` keys, like a RetrievalQA response.
+    """
+
+    def __init__(self, tiers: Dict[str, Callable[[str], dict]], scheduler: Optional[DegradationScheduler] = None,
+                 clock: Callable[[], float] = time.monotonic, max_abandoned: int = 4):
+        """
+        Initialize the TieredChain.
+
+        Args:
+        tiers (dict): Mapping of tier name to a callable answering a query
+        scheduler (DegradationScheduler): Scheduler used to pick tiers
+        clock (Callable): Monotonic clock returning seconds
+        max_abandoned (int): Maximum number of calls left running after a missed deadline; while
+            that many are still running, queries only get the retrieval-only tier
+        """
+        self.tiers = {name: tiers[name] for name in TIERS if name in tiers}
+        if TIER_FULL not in self.tiers or TIER_RETRIEVAL_ONLY not in self.tiers:
+            raise ValueError("TieredChain requires at least the 'full' and 'retrieval_only' tiers")
+        self.scheduler = scheduler or DegradationScheduler()
+        self.clock = clock
+        self.max_abandoned = max_abandoned
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def abandoned(self) -> int:
+        """Return the number of calls still running after missing their deadline."""
+        with self._lock:
+            return len(self._abandoned)
+
+    def run(self, query: str, budget: Optional[float] = None) -> Tuple[str, List, str]:
+        """
+        Answer a query, degrading through the tiers to stay within the budget.
+
+        Args:
+        query (str): The question to process
+        budget (float): Latency budget in seconds, or None to always run the full tier
+
+        Returns:
+        tuple: The answer, the source documents and the name of the tier used
+        """
+        if budget is None:
+            response = self._timed_call(TIER_FULL, query)
+            return response['result'], response['source_documents'], TIER_FULL
+
+        deadline = Deadline(budget, clock=self.clock)
+        candidates = tuple(self.tiers)
+        while True:
+            # Abandoned calls cannot be cancelled and keep spending tokens, so cap them
+            if self.abandoned() >= self.max_abandoned:
+                logger.warning(f"{self.max_abandoned} abandoned calls still running, answering from retrieval only")
+                break
+            tier = self.scheduler.choose(deadline.remaining(), candidates)
+            if tier == TIER_RETRIEVAL_ONLY:
+                break
+
+            # Keep enough time in reserve to fall back to the retrieval-only tier
+            timeout = deadline.remaining() - self.scheduler.estimate(TIER_RETRIEVAL_ONLY)
+            start = self.clock()
+            future = self._start(tier, query)
+            try:
+                response = future.result(timeout=max(0.0, timeout))
+                return response['result'], response['source_documents'], tier
+            except FutureTimeoutError:
+                # The call keeps running in the background and records its real
+                # latency when it completes; until then its latency is at least
+                # the time it was given.
+                with self._lock:
+                    if not future.done():
+                        self._abandoned.add(future)
+                self.scheduler.record_timeout(tier, self.clock() - start)
+                logger.warning(f"Tier '{tier}' missed the deadline for query: {query}")
+                break
+            except Exception as e:
+                logger.error(f"Tier '{tier}' failed for query '{query}': {e}")
+                candidates = candidates[candidates.index(tier) + 1:]
+
+        response = self._timed_call(TIER_RETRIEVAL_ONLY, query)
+        return response['result'], response['source_documents'], TIER_RETRIEVAL_ONLY
+
+    def _start(self, tier: str, query: str) -> Future:
+        """
+        Run one tier in its own daemon thread.
+
+        Each call gets a thread rather than a slot in a fixed pool, so calls
+        abandoned after a missed deadline cannot queue up later queries behind
+        them and make those miss their deadlines too.
+
+        Args:
+        tier (str): The tier to run
+        query (str): The question to process
+
+        Returns:
+        Future: The future of the tier's response
+        """
+        future = Future()
+
+        def call():
+            if not future.set_running_or_notify_cancel():
+                return
+            start = self.clock()
+            try:
+                response = self.tiers[tier](query)
+            except BaseException as e:
+                with self._lock:
+                    future.set_exception(e)
+                    self._abandoned.discard(future)
+                return
+            self.scheduler.record(tier, self.clock() - start)
+            # Completing under the lock keeps a call from being counted as abandoned after it finished
+            with self._lock:
+                future.set_result(response)
+                self._abandoned.discard(future)
+
+        threading.Thread(target=propagate(call), name=f"tiered-chain-{tier}", daemon=True).start()
+        return future
+
+    def _timed_call(self, tier: str, query: str) -> dict:
+        """
+        Run one tier and record its latency with the scheduler.
+
+        Args:
+        tier (str): The tier to run
+        query (str): The question to process
+
+        Returns:
+        dict: The tier's response
+        """
+        start = self.clock()
+        response = self.tiers[tier](query)
+        self.scheduler.record(tier, self.clock() - start)
+        return response
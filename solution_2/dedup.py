@@ -0,0 +1,167 @@
+"""
+dedup.py: Near-duplicate detection of text chunks with MinHash and LSH banding.
+
+This module collapses chunks whose word shingles are nearly identical, such as
+repeated headers, footers, legal boilerplate and the almost-identical chunks
+produced by overlapping splits, into a single chunk that keeps the page
+references of every chunk it replaces. Candidate pairs are found with
+locality-sensitive hashing, so the cost grows roughly linearly with the
+number of chunks.
+"""
+
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class NearDuplicateDetector:
+    """
+    Groups near-duplicate texts using MinHash signatures and LSH banding.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        """
+        Initialize the NearDuplicateDetector.
+
+        Args:
+        threshold (float): Minimum estimated Jaccard similarity for two texts to be near-duplicates
+        num_perm (int): Number of MinHash permutations
+        bands (int): Number of LSH bands; must divide num_perm
+        shingle_size (int): Number of words per shingle
+        seed (int): Seed of the permutation parameters, fixed so signatures are reproducible
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Compute the MinHash signature of a text.
+
+        Args:
+        text (str): The text to sign
+
+        Returns:
+        np.ndarray: The signature, one value per permutation
+        """
+        hashes = np.array([self._hash(shingle) for shingle in self._shingles(text)], dtype=np.uint64)
+        permuted = np.bitwise_and((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME, _MAX_HASH)
+        return permuted.min(axis=0)
+
+    def group(self, texts: List[str]) -> List[List[int]]:
+        """
+        Group the indices of near-duplicate texts.
+
+        Args:
+        texts (List[str]): The texts to group
+
+        Returns:
+        List[List[int]]: Groups of indices, in order of first occurrence; singletons included
+        """
+        signatures = [self.signature(text) for text in texts]
+        parent = list(range(len(texts)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            start = band * self.rows
+            for index, signature in enumerate(signatures):
+                buckets[signature[start:start + self.rows].tobytes()].append(index)
+            for candidates in buckets.values():
+                first = candidates[0]
+                for other in candidates[1:]:
+                    root_first, root_other = find(first), find(other)
+                    if root_first == root_other:
+                        continue
+                    # Confirm the candidate pair with the full signature before merging
+                    if np.mean(signatures[first] == signatures[other]) >= self.threshold:
+                        parent[max(root_first, root_other)] = min(root_first, root_other)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for index in range(len(texts)):
+            groups[find(index)].append(index)
+        return sorted(groups.values(), key=lambda indices: indices[0])
+
+    def _shingles(self, text: str) -> List[str]:
+        """
+        Split a text into overlapping word shingles.
+
+        Args:
+        text (str): The text to split
+
+        Returns:
+        List[str]: The shingles; the whole normalized text if it is shorter than one shingle
+        """
+        words = re.findall(r'\w+', text.lower())
+        if len(words) <= self.shingle_size:
+            return [" ".join(words)]
+        return [" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+    @staticmethod
+    def _hash(shingle: str) -> int:
+        """
+        Hash a shingle to a 64-bit integer.
+
+        Args:
+        shingle (str): The shingle to hash
+
+        Returns:
+        int: The hash value
+        """
+        return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little")
+
+
+def collapse_near_duplicates(chunks: List[Document], detector: NearDuplicateDetector = None) -> List[Document]:
+    """
+    Collapse near-duplicate chunks into one chunk per group.
+
+    The first chunk of each group is kept. Its ``pages`` metadata lists the
+    pages of every chunk in the group as a comma-separated string, since
+    vector store metadata values must be scalars.
+
+    Args:
+    chunks (List[Document]): The chunks to deduplicate
+    detector (NearDuplicateDetector): Detector to use; a default one if None
+
+    Returns:
+    List[Document]: The collapsed chunks
+    """
+    detector = detector or NearDuplicateDetector()
+    groups = detector.group([chunk.page_content for chunk in chunks])
+    collapsed = []
+    for indices in groups:
+        representative = chunks[indices[0]]
+        pages = []
+        for index in indices:
+            page = chunks[index].metadata.get("page", "N/A")
+            if page not in pages:
+                pages.append(page)
+        metadata = dict(representative.metadata)
+        metadata["pages"] = ",".join(str(page) for page in pages)
+        collapsed.append(Document(page_content=representative.page_content, metadata=metadata))
+    logger.info(f"Collapsed {len(chunks)} chunks into {len(collapsed)} after near-duplicate detection")
+    return collapsed
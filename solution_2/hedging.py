@@ -0,0 +1,340 @@
+"""
+hedging.py: Hedged LLM requests to cut tail latency.
+
+This module issues a duplicate of a slow OpenAI call once it has been running
+longer than a configurable percentile of recent call latencies, returns
+whichever attempt finishes first and abandons the other. Extra spend is capped
+as a fraction of the tokens sent by primary calls, and each policy records its
+hedge rate, the latency the hedges saved and the tokens spent by abandoned
+attempts. The defaults hedge calls slower than the 90th percentile within 15%
+extra spend: a percentile at or above the fraction of slow calls, or a cap
+below it, hedges too few calls to move the tail. Policies are process-wide and
+keyed by model, like the rate limiters; models without a policy are not hedged.
+Only the request itself is timed and hedged: time spent queued for rate limit
+admission is not latency a duplicate request could save.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from langchain_community.chat_models import ChatOpenAI
+from langchain_core.outputs import LLMResult
+
+from profiling import propagate
+from rate_limiter import DEFAULT_CHAT_LIMITS, DEFAULT_COMPLETION_TOKENS, RateLimitedChatOpenAI, count_tokens, get_rate_limiter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent call latencies.
+    """
+
+    def __init__(self, window: int = 200):
+        """
+        Initialize the LatencyTracker.
+
+        Args:
+        window (int): Number of most recent latencies kept
+        """
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        """Add a latency, in seconds."""
+        with self._lock:
+            self._recent.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Return a percentile of the recent latencies.
+
+        Args:
+        percentile (float): The percentile, between 0 and 100
+
+        Returns:
+        float or None: The latency in seconds, or None if nothing was recorded
+        """
+        with self._lock:
+            latencies = sorted(self._recent)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, int(round(percentile / 100.0 * len(latencies))) - 1))
+        return latencies[index]
+
+
+class HedgingPolicy:
+    """
+    Sends a duplicate of calls slower than a latency percentile, within a spend cap.
+    """
+
+    def __init__(self, percentile: float = 90.0, max_extra_spend: float = 0.15, min_samples: int = 20,
+                 window: int = 200, max_workers: int = 32, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the HedgingPolicy.
+
+        Args:
+        percentile (float): Latency percentile after which a call is hedged
+        max_extra_spend (float): Maximum hedge tokens as a fraction of primary call tokens
+        min_samples (int): Number of latencies to observe before hedging starts
+        window (int): Number of recent latencies the percentile is computed over
+        max_workers (int): Maximum number of attempts in flight
+        clock (Callable): Monotonic clock returning seconds
+        """
+        self.percentile = percentile
+        self.max_extra_spend = max_extra_spend
+        self.min_samples = min_samples
+        self.clock = clock
+        self.latencies = LatencyTracker(window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedged-call")
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "hedges_not_admitted": 0, "primary_tokens": 0,
+                       "hedge_tokens": 0, "abandoned_attempts": 0, "abandoned_tokens": 0, "latency_saved_total": 0.0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Return how long a call may run before it is hedged.
+
+        Returns:
+        float or None: Seconds, or None while too few latencies have been observed
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 1, admit: Optional[Callable[[], bool]] = None,
+             on_abandoned: Optional[Callable[[Any], Optional[int]]] = None) -> Any:
+        """
+        Run a call, hedging it with a duplicate if it is slow.
+
+        Python cannot interrupt a request in flight, so the losing attempt is
+        abandoned: its result is discarded when it completes.
+
+        Args:
+        fn (Callable): The call to make; must be safe to run twice concurrently
+        tokens (int): Estimated token cost of one attempt
+        admit (Callable): Admits the hedge against a rate limit without waiting, returning False if
+            it would have to queue; the hedge is then not sent
+        on_abandoned (Callable): Called with the result of the losing attempt when it completes,
+            returning its real token usage if known
+
+        Returns:
+        Any: The return value of the first attempt to succeed
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["primary_tokens"] += tokens
+        start = self.clock()
+        delay = self.hedge_delay()
+        if delay is None:
+            # Still learning the latency distribution: no hedging, no thread hop
+            result = fn()
+            self.latencies.record(self.clock() - start)
+            return result
+
+        primary = self._submit(fn)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._reserve(tokens, admit):
+            return primary.result()
+
+        logger.info(f"Call still running after {delay:.2f}s (p{self.percentile:g}), sending a hedged request")
+        hedge = self._submit(fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                    self._track_abandoned(loser, tokens, on_abandoned)
+                if future is hedge:
+                    self._record_hedge_win(primary, self.clock())
+                logger.info(f"{'Hedged' if future is hedge else 'Primary'} request won after {self.clock() - start:.2f}s")
+                return future.result()
+        raise error
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hedging metrics.
+
+        Returns:
+        dict: Counters, the hedge rate, the extra spend ratio and the latency saved in seconds
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+        stats["extra_spend"] = stats["hedge_tokens"] / stats["primary_tokens"] if stats["primary_tokens"] else 0.0
+        stats["hedge_delay"] = self.hedge_delay()
+        return stats
+
+    def _submit(self, fn: Callable[[], Any]):
+        """
+        Start one attempt, recording its latency when it completes successfully.
+
+        Args:
+        fn (Callable): The call to make
+
+        Returns:
+        Future: The attempt
+        """
+        started = self.clock()
+
+        def attempt():
+            result = fn()
+            self.latencies.record(self.clock() - started)
+            return result
+
+        return self._executor.submit(propagate(attempt))
+
+    def _reserve(self, tokens: int, admit: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Account for a hedge if it fits within the extra spend cap and is admitted.
+
+        Args:
+        tokens (int): Estimated token cost of the hedge
+        admit (Callable): Admits the hedge against a rate limit without waiting
+
+        Returns:
+        bool: True if the hedge may be sent
+        """
+        with self._lock:
+            if self._stats["hedge_tokens"] + tokens > self.max_extra_spend * self._stats["primary_tokens"]:
+                return False
+            if admit is not None and not admit():
+                # A hedge stuck behind the same throttled queue could not win
+                self._stats["hedges_not_admitted"] += 1
+                return False
+            self._stats["hedged"] += 1
+            self._stats["hedge_tokens"] += tokens
+            return True
+
+    def _track_abandoned(self, attempt, tokens: int, on_abandoned: Optional[Callable[[Any], Optional[int]]] = None):
+        """
+        Account for the tokens of an abandoned attempt once it completes.
+
+        Args:
+        attempt (Future): The abandoned attempt
+        tokens (int): Estimated token cost of the attempt, used when its real usage is unknown
+        on_abandoned (Callable): Called with the attempt's result, returning its real token usage if known
+        """
+        def record_spend(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            used = None
+            if on_abandoned is not None:
+                try:
+                    used = on_abandoned(future.result())
+                except Exception as e:
+                    logger.error(f"Error reporting abandoned attempt: {e}")
+            with self._lock:
+                self._stats["abandoned_attempts"] += 1
+                self._stats["abandoned_tokens"] += used if used is not None else tokens
+
+        attempt.add_done_callback(record_spend)
+
+    def _record_hedge_win(self, primary, won_at: float):
+        """
+        Record a hedge win; the latency saved is known once the abandoned primary completes.
+
+        Args:
+        primary (Future): The abandoned primary attempt
+        won_at (float): Clock reading when the hedge completed
+        """
+        with self._lock:
+            self._stats["hedge_wins"] += 1
+
+        def record_saving(future):
+            if not future.cancelled() and future.exception() is None:
+                with self._lock:
+                    self._stats["latency_saved_total"] += max(0.0, self.clock() - won_at)
+
+        primary.add_done_callback(record_saving)
+
+
+_policies: Dict[str, HedgingPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def configure_hedging(model: str, **kwargs) -> HedgingPolicy:
+    """
+    Enable hedging for a model.
+
+    Args:
+    model (str): The OpenAI model name
+    **kwargs: Keyword arguments of HedgingPolicy
+
+    Returns:
+    HedgingPolicy: The policy now used for the model
+    """
+    with _policies_lock:
+        _policies[model] = HedgingPolicy(**kwargs)
+        return _policies[model]
+
+
+def get_hedging_policy(model: str) -> Optional[HedgingPolicy]:
+    """
+    Return the hedging policy of a model, if hedging is enabled for it.
+
+    Hedging is enabled for every model by setting the ``OPENAI_HEDGE_PERCENTILE``
+    environment variable, with ``OPENAI_HEDGE_MAX_EXTRA_SPEND`` capping the
+    extra spend, or per model with configure_hedging.
+
+    Args:
+    model (str): The OpenAI model name
+
+    Returns:
+    HedgingPolicy or None: The policy, or None if calls to the model are not hedged
+    """
+    with _policies_lock:
+        if model not in _policies and os.getenv("OPENAI_HEDGE_PERCENTILE"):
+            _policies[model] = HedgingPolicy(
+                percentile=float(os.getenv("OPENAI_HEDGE_PERCENTILE")),
+                max_extra_spend=float(os.getenv("OPENAI_HEDGE_MAX_EXTRA_SPEND", 0.15))
+            )
+        return _policies.get(model)
+
+
+class HedgedChatOpenAI(RateLimitedChatOpenAI):
+    """
+    Rate-limited ChatOpenAI whose slow requests are hedged by the policy of its model.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        """Generate, hedging the request once admitted if hedging is enabled for the model."""
+        policy = get_hedging_policy(self.model_name)
+        if policy is None:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        texts = [message.content if isinstance(message.content, str) else str(message.content) for message in messages]
+        tokens = count_tokens(texts, self.model_name) + 4 * len(messages) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+        limiter = get_rate_limiter(self.model_name, DEFAULT_CHAT_LIMITS)
+
+        def request():
+            return ChatOpenAI._generate(self, messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        def report_abandoned(result):
+            # The callbacks only see the winning attempt, so report the loser's usage to get_openai_callback
+            usage = LLMResult(generations=[result.generations], llm_output=result.llm_output)
+            for handler in (run_manager.handlers if run_manager is not None else []):
+                if isinstance(handler, OpenAICallbackHandler):
+                    handler.on_llm_end(usage)
+            return ((result.llm_output or {}).get("token_usage") or {}).get("total_tokens")
+
+        # The primary waits for admission before the policy starts timing it; a hedge is
+        # sent only if the limiter admits it at once, so it counts against the quota too
+        return limiter.call(lambda: policy.call(request, tokens, admit=lambda: limiter.try_acquire(tokens),
+                                                on_abandoned=report_abandoned), tokens)
@@ -0,0 +1,148 @@
+"""
+hedging_benchmark.py: Tail latency of hedged calls against a heavy-tailed fake LLM.
+
+This script answers the same sequence of calls with and without a
+HedgingPolicy. Every attempt, hedges included, draws its own latency from a
+fake model whose calls are usually fast but occasionally many times slower,
+like the slow OpenAI responses hedging is meant to absorb. It reports the
+latency percentiles of both runs and the policy's hedge rate, extra spend and
+latency saved. No OpenAI calls are made.
+
+Usage:
+    python hedging_benchmark.py
+    python hedging_benchmark.py --percentile 95 --max-extra-spend 0.05 --calls 1000
+"""
+
+import time
+import random
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+
+from hedging import HedgingPolicy
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class HeavyTailedFakeLLM:
+    """
+    A fake model call whose latency is usually fast and occasionally much slower.
+    """
+
+    def __init__(self, base_latency: float = 0.02, tail_rate: float = 0.05, tail_factor: float = 20.0, seed: int = 0):
+        """
+        Initialize the HeavyTailedFakeLLM.
+
+        Args:
+        base_latency (float): Mean latency of a normal call, in seconds
+        tail_rate (float): Fraction of calls in the slow tail
+        tail_factor (float): How many times slower than base_latency a tail call is
+        seed (int): Seed of the latency draws
+        """
+        self.base_latency = base_latency
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def latency(self) -> float:
+        """Draw the latency of one call, in seconds."""
+        with self._lock:
+            if self._random.random() < self.tail_rate:
+                return self.base_latency * self.tail_factor
+            return self._random.uniform(0.5, 1.5) * self.base_latency
+
+    def __call__(self) -> str:
+        """Make one call."""
+        time.sleep(self.latency())
+        return "answer"
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """
+    Return a percentile of a list of latencies.
+
+    Args:
+    latencies (List[float]): The latencies, in seconds
+    percent (float): The percentile, between 0 and 100
+
+    Returns:
+    float: The latency at that percentile
+    """
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(percent / 100.0 * len(ordered)))]
+
+
+def run(llm: HeavyTailedFakeLLM, calls: int, policy: Optional[HedgingPolicy] = None,
+        tokens: int = 1000) -> Dict[str, Any]:
+    """
+    Make a sequence of calls and measure their latencies.
+
+    Args:
+    llm (HeavyTailedFakeLLM): The fake model
+    calls (int): Number of calls
+    policy (HedgingPolicy): Policy hedging the calls, or None for plain calls
+    tokens (int): Token cost of one attempt, used for the extra spend cap
+
+    Returns:
+    dict: Latency percentiles in seconds, and the policy's stats if any
+    """
+    latencies = []
+    for _ in range(calls):
+        start = time.monotonic()
+        if policy is None:
+            llm()
+        else:
+            policy.call(llm, tokens)
+        latencies.append(time.monotonic() - start)
+
+    report = {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+              "max": max(latencies), "mean": sum(latencies) / len(latencies)}
+    if policy is not None:
+        # Let abandoned attempts finish so that the latency saved is complete
+        time.sleep(llm.base_latency * llm.tail_factor)
+        report["stats"] = policy.stats()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Parse command-line arguments and run the benchmark.
+
+    Args:
+    argv (list): Command-line arguments, defaults to sys.argv
+
+    Returns:
+    int: Process exit code
+    """
+    parser = argparse.ArgumentParser(description="Compare tail latency with and without hedging on a fake LLM.")
+    parser.add_argument("--calls", type=int, default=400, help="Number of calls per run")
+    parser.add_argument("--base-latency", type=float, default=0.02, help="Mean latency of a normal call in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="Fraction of calls in the slow tail")
+    parser.add_argument("--tail-factor", type=float, default=20.0, help="Slowdown of a tail call")
+    parser.add_argument("--percentile", type=float, default=90.0, help="Latency percentile after which calls are hedged")
+    parser.add_argument("--max-extra-spend", type=float, default=0.15, help="Maximum hedge spend as a fraction of primary spend")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency draws")
+    args = parser.parse_args(argv)
+
+    def fake_llm():
+        return HeavyTailedFakeLLM(args.base_latency, args.tail_rate, args.tail_factor, args.seed)
+
+    baseline = run(fake_llm(), args.calls)
+    hedged = run(fake_llm(), args.calls, HedgingPolicy(percentile=args.percentile, max_extra_spend=args.max_extra_spend))
+    stats = hedged["stats"]
+
+    print(f"{'':10}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'mean':>8}")
+    for name, report in (("plain", baseline), ("hedged", hedged)):
+        print(f"{name:10}" + "".join(f"{report[key]:>8.3f}" for key in ("p50", "p95", "p99", "max", "mean")))
+    print(f"\nhedge rate {stats['hedge_rate']:.1%}, extra spend {stats['extra_spend']:.1%}, "
+          f"hedge wins {stats['hedge_wins']}, latency saved {stats['latency_saved_total']:.2f}s, "
+          f"abandoned attempts {stats['abandoned_attempts']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
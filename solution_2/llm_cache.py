@@ -0,0 +1,225 @@
+"""
+llm_cache.py: Persistent, size-bounded cache of individual LLM calls.
+
+This module caches LLM generations in a SQLite database keyed by the model
+configuration (model name, temperature, ...) and a hash of the full prompt, so
+that identical compression and generation prompts are never paid for twice,
+across questions and across runs. Hit statistics are kept per call site.
+"""
+
+import sqlite3
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class LLMCache(BaseCache):
+    """
+    A SQLite-backed LangChain cache with least-recently-used eviction.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 50000):
+        """
+        Initialize the LLMCache with the path to the SQLite database.
+
+        Args:
+        db_path (str): Path to the SQLite database file
+        max_entries (int): Maximum number of cached generations kept before evicting
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database with the required table."""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                llm_string_hash TEXT,
+                prompt_hash TEXT,
+                return_val TEXT,
+                last_access REAL
+            )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+            conn.commit()
+
+    def for_call_site(self, call_site: str) -> "CallSiteCache":
+        """
+        Return a view of this cache that records statistics under a call site name.
+
+        Args:
+        call_site (str): Name of the call site, e.g. "compressor" or "generator"
+
+        Returns:
+        CallSiteCache: The call-site view, to be passed as ``cache=`` to a chat model
+        """
+        return CallSiteCache(self, call_site)
+
+    def lookup(self, prompt: str, llm_string: str, call_site: str = "default") -> Optional[RETURN_VAL_TYPE]:
+        """
+        Look up cached generations for a prompt.
+
+        Args:
+        prompt (str): The serialized prompt
+        llm_string (str): The serialized model configuration
+        call_site (str): Call site the statistics are recorded under
+
+        Returns:
+        list or None: The cached generations if found, None otherwise
+        """
+        cache_key = self._compute_cache_key(prompt, llm_string)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT return_val FROM llm_cache WHERE cache_key = ?", (cache_key,))
+                result = cursor.fetchone()
+                if result:
+                    cursor.execute("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key))
+                    conn.commit()
+        except Exception as e:
+            logger.error(f"Error reading LLM cache: {e}")
+            result = None
+
+        self._record(call_site, hit=bool(result))
+        if result:
+            return [loads(generation) for generation in json.loads(result[0])]
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        """
+        Store the generations produced for a prompt.
+
+        Args:
+        prompt (str): The serialized prompt
+        llm_string (str): The serialized model configuration
+        return_val (list): The generations to cache
+        """
+        cache_key = self._compute_cache_key(prompt, llm_string)
+        serialized = json.dumps([dumps(generation) for generation in return_val])
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO llm_cache (cache_key, llm_string_hash, prompt_hash, return_val, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, self._hash(llm_string), self._hash(prompt), serialized, time.time())
+                )
+                self._evict(cursor)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing LLM cache: {e}")
+
+    def clear(self, **kwargs: Any):
+        """Remove every cached generation and reset the statistics."""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+        with self._stats_lock:
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Return hit and miss counts per call site.
+
+        Returns:
+        dict: Mapping of call site to a dictionary with ``hits`` and ``misses``
+        """
+        with self._stats_lock:
+            return {site: dict(counts) for site, counts in self._stats.items()}
+
+    def _evict(self, cursor):
+        """
+        Delete the least recently used entries beyond ``max_entries``.
+
+        Args:
+        cursor: Cursor of the open SQLite connection
+        """
+        cursor.execute("SELECT COUNT(*) FROM llm_cache")
+        excess = cursor.fetchone()[0] - self.max_entries
+        if excess > 0:
+            cursor.execute(
+                "DELETE FROM llm_cache WHERE cache_key IN (SELECT cache_key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def _record(self, call_site: str, hit: bool):
+        """
+        Count a lookup for a call site.
+
+        Args:
+        call_site (str): The call site name
+        hit (bool): Whether the lookup was a hit
+        """
+        with self._stats_lock:
+            counts = self._stats.setdefault(call_site, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    @classmethod
+    def _compute_cache_key(cls, prompt: str, llm_string: str) -> str:
+        """
+        Compute the cache key from the model configuration and the prompt.
+
+        Args:
+        prompt (str): The serialized prompt
+        llm_string (str): The serialized model configuration, including model name and temperature
+
+        Returns:
+        str: SHA-256 hash combining both hashes
+        """
+        return cls._hash(cls._hash(llm_string) + cls._hash(prompt))
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        """
+        Hash a string.
+
+        Args:
+        text (str): The string to hash
+
+        Returns:
+        str: SHA-256 hex digest of the string
+        """
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+class CallSiteCache(BaseCache):
+    """
+    A view of an LLMCache that attributes hits and misses to one call site.
+    """
+
+    def __init__(self, cache: LLMCache, call_site: str):
+        """
+        Initialize the CallSiteCache.
+
+        Args:
+        cache (LLMCache): The shared cache
+        call_site (str): Name the statistics are recorded under
+        """
+        self.cache = cache
+        self.call_site = call_site
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Look up cached generations, recording the result for this call site."""
+        return self.cache.lookup(prompt, llm_string, call_site=self.call_site)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        """Store generations in the shared cache."""
+        self.cache.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any):
+        """Clear the shared cache."""
+        self.cache.clear(**kwargs)
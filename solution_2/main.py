@@ -16,6 +16,15 @@ from pdf_extractor import PDFExtractor
 from chain import ChainManager
 from slack_post import SlackManager
 from cache_manager import CacheManager
+from cache_backend import create_cache_backend
+from deadline import TIER_FULL, Deadline
+from hedging import get_hedging_policy
+from llm_cache import LLMCache
+from multi_question import TIER_BATCHED
+from pipeline import SOLUTION_2
+from prewarm import CacheWarmer, get_traffic_gate
+from profiling import get_profiler
+from rate_limiter import get_rate_limiter
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,7 +44,41 @@ os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 # SQLite database setup
 DB_PATH = 'qa_cache.db'
 
-def process_questions(qa_chain, questions, cache_manager):
+# Answer cache location: an SQLite path, or redis://host:port/db for a cache shared by all replicas
+CACHE_URL = os.getenv("CACHE_URL", DB_PATH)
+LLM_CACHE_PATH = 'llm_cache.db'
+
+# Standard question set asked of every document
+DEFAULT_QUESTIONS = [
+    "What is the name of the company?",
+    "Who is the CEO of the company?",
+    "What is their vacation policy?",
+    "What is the termination policy?",
+    "What is their retention policy?"
+]
+
+# Questions answered in the background whenever a new document is indexed
+PREWARM_QUESTIONS = DEFAULT_QUESTIONS
+
+def format_source(doc, cite_sections=True):
+    """
+    Format the section and page reference of a source document.
+
+    Args:
+    doc (Document): A source document
+    cite_sections (bool): Whether to include the section, for pipelines that tag sections
+
+    Returns:
+    str: The formatted reference, listing every page of a collapsed near-duplicate chunk
+    """
+    pages = str(doc.metadata.get('pages', doc.metadata.get('page', 'N/A'))).split(',')
+    reference = f"Pages {', '.join(pages)}" if len(pages) > 1 else f"Page {pages[0]}"
+    if not cite_sections:
+        return reference
+    return f"Section {doc.metadata.get('section', 'N/A')}, {reference}"
+
+def process_questions(qa_chain, questions, cache_manager, budget=None, batch_questions=False, config=SOLUTION_2,
+                      profiler=None):
     """
     Process a list of questions and return results.
     
@@ -43,72 +86,242 @@ def process_questions(qa_chain, questions, cache_manager):
     qa_chain: The question-answering chain
     questions (list): List of questions to process
     cache_manager (CacheManager): Instance of CacheManager for caching answers
+    budget (float): Optional per-question latency budget in seconds
+    batch_questions (bool): Answer cache-missed questions that share retrieved context in a single LLM call;
+        ignored when a budget is set. Batched answers skip contextual compression, so they are cached apart
+        from full answers and only served to calls that batch too
+    config (PipelineConfig): Pipeline settings the chain was built with
+    profiler (Profiler): Profiler sampling answered questions; the process-wide one, set up from
+        QA_PROFILE_RATE and QA_PROFILE_DIR, if None
 
     Returns:
     dict: A dictionary with questions as keys and results as values
     """
     results = {}
-    for question in questions:
+    misses = []
+    gate = get_traffic_gate(cache_manager.namespace)
+    profiler = profiler or get_profiler()
+    # Live for the whole call, so that no cache warmer starts on a question this call is about to answer
+    with gate.live():
         try:
-            # Check if the question is in the cache
-            cached_result = cache_manager.get_cached_answer(question)
+            # Look all the questions up in the cache in one round trip
+            cached_results = cache_manager.get_cached_answers(questions)
+        except Exception as e:
+            logger.error(f"Error looking up cached answers: {e}")
+            cached_results = {}
+        for question in questions:
+            cached_result = cached_results.get(question)
             if cached_result:
                 logger.info(f"Cache hit for question: {question}")
-                results[question] = cached_result
+                results[question] = dict(cached_result, tier="cache")
             else:
                 logger.info(f"Cache miss for question: {question}")
-                answer, sources = ChainManager.process_query(qa_chain, question)
+                misses.append(question)
+        # Questions a cache warmer is already answering are waited for instead of paid for twice
+        warming = {question for question in misses if gate.is_warming(warm_key(cache_manager, question))}
+
+        batched_answers = {}
+        if batch_questions and budget is None and misses:
+            results.update(take_warmed_answers(gate, cache_manager, [question for question in misses if question in warming]))
+            misses = [question for question in misses if question not in results]
+            try:
+                batched_results = cache_manager.for_tier(TIER_BATCHED).get_cached_answers(misses)
+            except Exception as e:
+                logger.error(f"Error looking up cached batched answers: {e}")
+                batched_results = {}
+            results.update({question: dict(batched_results[question], tier="cache")
+                            for question in misses if batched_results.get(question)})
+            misses = [question for question in misses if question not in results]
+            if misses:
+                with profiler.profile("batch", "\n".join(misses)):
+                    batched_answers = ChainManager.process_queries_batched(qa_chain, misses)
+
+        for question in misses:
+            try:
+                if question in batched_answers:
+                    answer, sources, tier = batched_answers[question]
+                else:
+                    # Waiting for a pre-warmed answer counts against the question's budget
+                    deadline = Deadline(budget) if budget is not None else None
+                    warmed = take_warmed_answers(gate, cache_manager, [question], deadline) if question in warming else {}
+                    if question in warmed:
+                        results[question] = warmed[question]
+                        continue
+                    with profiler.profile("question", question):
+                        answer, sources, tier = ChainManager.process_query(
+                            qa_chain, question, budget=deadline.remaining() if deadline else None)
                 result = {
                     "answer": answer,
-                    "sources": [f"Section {doc.metadata.get('section', 'N/A')}, Page {doc.metadata.get('page', 'N/A')}" for doc in sources[:10]]
+                    "sources": [format_source(doc, config.tag_sections) for doc in sources[:10]],
+                    "tier": tier
                 }
                 results[question] = result
-                
-                # Update the cache
-                cache_manager.cache_answer(question, answer, result["sources"])
-        except Exception as e:
-            logger.error(f"Error processing question '{question}': {e}")
-            results[question] = {"answer": "An error occurred while processing this question.", "sources": []}
-    
-    return results
 
-def main(pdf_path, questions):
+                # Update the cache, keeping degraded answers out of it and batched answers apart
+                if tier in (TIER_FULL, TIER_BATCHED):
+                    try:
+                        tier_cache = cache_manager if tier == TIER_FULL else cache_manager.for_tier(TIER_BATCHED)
+                        tier_cache.cache_answer(question, answer, result["sources"])
+                    except Exception as e:
+                        # An unreachable cache must not cost us an answer we already paid for
+                        logger.error(f"Error caching answer for question '{question}': {e}")
+            except Exception as e:
+                logger.error(f"Error processing question '{question}': {e}")
+                results[question] = {"answer": "An error occurred while processing this question.", "sources": [], "tier": None}
+
+    # Keep the order in which the questions were asked
+    return {question: results[question] for question in questions}
+
+def take_warmed_answers(gate, cache_manager, questions, deadline=None):
+    """
+    Wait for the questions a cache warmer is answering and take their answers from the cache.
+
+    Args:
+    gate (TrafficGate): The traffic gate the warmers use
+    cache_manager (CacheManager): The cache the warmers write to
+    questions (list): Questions that were being warmed
+    deadline (Deadline): Optional deadline bounding the wait
+
+    Returns:
+    dict: Cached results of the questions that have an answer now
+    """
+    if not questions:
+        return {}
+    logger.info(f"Waiting for {len(questions)} questions being pre-warmed")
+    gate.wait_for_warming([warm_key(cache_manager, question) for question in questions],
+                          timeout=deadline.remaining() if deadline else None)
+    try:
+        warmed_results = cache_manager.get_cached_answers(questions)
+    except Exception as e:
+        logger.error(f"Error looking up pre-warmed answers: {e}")
+        return {}
+    return {question: dict(warmed_results[question], tier="cache") for question in questions if warmed_results.get(question)}
+
+def warm_key(cache_manager, question):
+    """
+    Return the key under which a question being pre-warmed is tracked on the traffic gate.
+
+    Args:
+    cache_manager (CacheManager): The cache the answer goes to
+    question (str): The question
+
+    Returns:
+    tuple: The cache namespace and the question
+    """
+    return (cache_manager.namespace, question)
+
+def create_prewarm_hook(pdf_extractor, chain_manager, cache_manager, questions=PREWARM_QUESTIONS, max_workers=2):
+    """
+    Create a PDFExtractor index creation hook that pre-warms the answer cache.
+
+    Args:
+    pdf_extractor (PDFExtractor): Extractor the hook is installed on
+    chain_manager (ChainManager): Manager used to build the chain over the new index
+    cache_manager (CacheManager): Cache populated with the answers
+    questions (list): Questions to answer in the background
+    max_workers (int): Maximum number of questions answered concurrently
+
+    Returns:
+    tuple: The hook, and the list the started CacheWarmer instances are appended to
+    """
+    warmers = []
+
+    def on_index_created(vectorstore, pdf_path, chunk_store):
+        section_index = pdf_extractor.get_section_index(pdf_path, vectorstore)
+        qa_chain = chain_manager.create_advanced_chain(vectorstore, chunk_store=chunk_store, section_index=section_index)
+        if not qa_chain:
+            logger.error(f"Cannot pre-warm the cache for {pdf_path}: failed to create QA chain")
+            return
+
+        def warm_question(question):
+            if cache_manager.get_cached_answer(question):
+                return
+            answer, sources, tier = ChainManager.process_query(qa_chain, question)
+            if tier == TIER_FULL:
+                cache_manager.cache_answer(question, answer, [format_source(doc, chain_manager.config.tag_sections) for doc in sources[:10]])
+
+        warmer = CacheWarmer(questions, warm_question, max_workers=max_workers,
+                             gate=get_traffic_gate(cache_manager.namespace),
+                             key_fn=lambda question: warm_key(cache_manager, question))
+        warmer.start()
+        warmers.append(warmer)
+
+    return on_index_created, warmers
+
+def build_qa_chain(pdf_path, pdf_extractor, chain_manager, budget=None):
+    """
+    Extract, chunk and index a PDF, then build the question-answering chain over it.
+
+    Args:
+    pdf_path (str): Path to the PDF file
+    pdf_extractor (PDFExtractor): Extractor used to read and index the PDF
+    chain_manager (ChainManager): Manager used to build the chain
+    budget (float): Optional per-question latency budget; builds a deadline-aware chain when set
+
+    Returns:
+    The question-answering chain
+
+    Raises:
+    ValueError: If any stage of the pipeline fails
+    """
+    pages = pdf_extractor.get_pdf_text(pdf_path)
+    if not pages:
+        raise ValueError("Failed to extract text from PDF")
+
+    text_chunks = pdf_extractor.get_text_chunks(pages)
+    if not text_chunks:
+        raise ValueError("Failed to create text chunks")
+
+    vectorstore = pdf_extractor.get_vectorstore(text_chunks, pdf_path)
+    if not vectorstore:
+        raise ValueError("Failed to create vector store")
+
+    chunk_store = pdf_extractor.get_chunk_store(pdf_path)
+    section_index = pdf_extractor.get_section_index(pdf_path, vectorstore)
+    if budget is None:
+        qa_chain = chain_manager.create_advanced_chain(vectorstore, chunk_store=chunk_store, section_index=section_index)
+    else:
+        qa_chain = chain_manager.create_tiered_chain(vectorstore, chunk_store=chunk_store, section_index=section_index)
+    if not qa_chain:
+        raise ValueError("Failed to create QA chain")
+    return qa_chain
+
+def main(pdf_path, questions, budget=None, batch_questions=False, prewarm=False, config=SOLUTION_2):
     """
     Main function to process PDF and answer questions.
     
     Args:
     pdf_path (str): Path to the PDF file
     questions (list): List of questions to answer
+    budget (float): Optional per-question latency budget in seconds; enables graceful degradation
+    batch_questions (bool): Answer questions sharing retrieved context in a single LLM call
+    prewarm (bool): Answer PREWARM_QUESTIONS in the background if the PDF gets newly indexed
+    config (PipelineConfig): Pipeline settings, e.g. a preset from pipeline.py
 
     Returns:
     str: JSON string containing the results
     """
     try:
         # Initialize managers
-        cache_manager = CacheManager(DB_PATH)
-        pdf_extractor = PDFExtractor()
-        chain_manager = ChainManager(OPENAI_API_KEY)
+        cache_manager = CacheManager(namespace=config.cache_namespace, backend=create_cache_backend(CACHE_URL))
+        llm_cache = LLMCache(LLM_CACHE_PATH)
+        chain_manager = ChainManager(OPENAI_API_KEY, llm_cache=llm_cache, config=config)
+        pdf_extractor = PDFExtractor(config=config)
+        warmers = []
+        if prewarm:
+            pdf_extractor.on_index_created, warmers = create_prewarm_hook(pdf_extractor, chain_manager, cache_manager)
         slack_manager = SlackManager(SLACK_BOT_TOKEN)
 
-        # Process PDF
-        pages = pdf_extractor.get_pdf_text(pdf_path)
-        if not pages:
-            raise ValueError("Failed to extract text from PDF")
-
-        text_chunks = pdf_extractor.get_text_chunks(pages)
-        if not text_chunks:
-            raise ValueError("Failed to create text chunks")
-
-        vectorstore = pdf_extractor.get_vectorstore(text_chunks, pdf_path)
-        if not vectorstore:
-            raise ValueError("Failed to create vector store")
-
-        qa_chain = chain_manager.create_advanced_chain(vectorstore)
-        if not qa_chain:
-            raise ValueError("Failed to create QA chain")
+        qa_chain = build_qa_chain(pdf_path, pdf_extractor, chain_manager, budget=budget)
 
         # Process questions and get answers
-        results = process_questions(qa_chain, questions, cache_manager)
+        results = process_questions(qa_chain, questions, cache_manager, budget=budget, batch_questions=batch_questions,
+                                    config=config)
+        logger.info(f"LLM cache statistics: {llm_cache.stats()}")
+        logger.info(f"OpenAI rate limiter statistics: {get_rate_limiter(ChainManager.MODEL_NAME).stats()}")
+        hedging_policy = get_hedging_policy(ChainManager.MODEL_NAME)
+        if hedging_policy is not None:
+            logger.info(f"OpenAI hedging statistics: {hedging_policy.stats()}")
 
         # Convert results to JSON
         json_results = json.dumps(results, indent=2)
@@ -117,6 +330,10 @@ def main(pdf_path, questions):
         slack_channel = "#qa"
         slack_manager.post_to_slack(slack_channel, f"AI Agent Results:\n```{json_results}```")
 
+        # Let background warming finish before the process exits
+        for warmer in warmers:
+            warmer.join()
+
         return json_results
     except Exception as e:
         logger.error(f"An error occurred in the main function: {e}")
@@ -124,12 +341,5 @@ def main(pdf_path, questions):
 
 if __name__ == "__main__":
     pdf_path = "data/handbook.pdf"
-    questions = [
-        "What is the name of the company?",
-        "Who is the CEO of the company?",
-        "What is their vacation policy?",
-        "What is the termination policy?",
-        "What is their retention policy?"
-    ]
-    results = main(pdf_path, questions)
+    results = main(pdf_path, DEFAULT_QUESTIONS)
     print(results)
\ No newline at end of file
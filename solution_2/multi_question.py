@@ -0,0 +1,218 @@
+"""
+multi_question.py: Answers several questions that share retrieved context in one LLM call.
+
+Questions from a standard intake set often retrieve overlapping chunks. This
+module groups questions by the overlap of their retrieved chunks and answers
+each group with a single generation call over the union of the group's
+context, asking for structured JSON output with one answer per question.
+Answers that cannot be attributed to their question fall back to the
+regular one-question-per-call path, reusing the chunks already retrieved.
+"""
+
+import re
+import json
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tier recorded for answers produced by a multi-question call
+TIER_BATCHED = "batched"
+
+MULTI_QUESTION_PROMPT = PromptTemplate(
+    input_variables=["context", "questions"],
+    template=(
+        "Given the following context:\n\n{context}\n\n"
+        "Answer each of the following questions:\n{questions}\n\n"
+        "If the answer to a question is not explicitly stated in the context, try to find keywords matching. "
+        "Else, answer 'Data Not Available'. Include the section number in your answer when possible.\n\n"
+        "Respond only with a JSON object of the form "
+        "{{\"answers\": [{{\"id\": <question number>, \"answer\": \"<answer>\"}}]}} "
+        "containing one answer per question."
+    )
+)
+
+
+class MultiQuestionAnswerer:
+    """
+    Groups questions by retrieved-chunk overlap and answers each group in one call.
+    """
+
+    def __init__(self, retriever, llm, document_prompt: PromptTemplate, overlap_threshold: float = 0.5,
+                 max_group_size: int = 5, max_context_docs: int = 12):
+        """
+        Initialize the MultiQuestionAnswerer.
+
+        Args:
+        retriever: Retriever supplying each question's context, without compression
+        llm: The language model generating the answers
+        document_prompt (PromptTemplate): Template formatting each context document
+        overlap_threshold (float): Minimum fraction of a question's chunks already in a group for it to join
+        max_group_size (int): Maximum number of questions answered by one call
+        max_context_docs (int): Maximum number of chunks sent as context to one call
+        """
+        self.retriever = retriever
+        self.llm = llm
+        self.document_prompt = document_prompt
+        self.overlap_threshold = overlap_threshold
+        self.max_group_size = max_group_size
+        self.max_context_docs = max_context_docs
+
+    def answer(self, questions: List[str], fallback: Callable[..., Tuple[str, List[Document], Optional[str]]]) -> Dict[str, Tuple[str, List[Document], Optional[str]]]:
+        """
+        Answer a list of questions, batching those that share context.
+
+        The source documents of a batched answer are the question's retrieved
+        documents that were sent in the prompt.
+
+        Args:
+        questions (List[str]): The questions to answer
+        fallback (Callable): Answers a single question, given its already retrieved documents if any;
+            used for singleton groups and unattributed answers
+
+        Returns:
+        dict: Mapping of question to a tuple of answer, source documents and tier
+        """
+        retrieved = {}
+        for question in questions:
+            try:
+                retrieved[question] = self.retriever.get_relevant_documents(question)
+            except Exception as e:
+                logger.error(f"Error retrieving documents for question '{question}': {e}")
+
+        results = {}
+        for group in self.group(retrieved):
+            if len(group) == 1:
+                results[group[0]] = fallback(group[0], retrieved[group[0]])
+                continue
+            context = self._merge_context(group, retrieved)
+            answers = self._answer_group(group, context)
+            in_prompt = {self._chunk_id(document) for document in context}
+            for question in group:
+                if question in answers:
+                    sources = [document for document in retrieved[question] if self._chunk_id(document) in in_prompt]
+                    results[question] = (answers[question], sources, TIER_BATCHED)
+                else:
+                    logger.warning(f"No attributable answer in the batched response, retrying alone: {question}")
+                    results[question] = fallback(question, retrieved[question])
+
+        # Questions whose retrieval failed go through the regular path, which reports their errors
+        for question in questions:
+            if question not in results:
+                results[question] = fallback(question)
+        return results
+
+    def group(self, retrieved: Dict[str, List[Document]]) -> List[List[str]]:
+        """
+        Greedily group questions whose retrieved chunks overlap.
+
+        Args:
+        retrieved (dict): Mapping of question to its retrieved documents
+
+        Returns:
+        List[List[str]]: Groups of questions
+        """
+        groups: List[Tuple[List[str], set]] = []
+        for question, documents in retrieved.items():
+            chunk_ids = {self._chunk_id(document) for document in documents}
+            for members, group_chunk_ids in groups:
+                if len(members) >= self.max_group_size or not chunk_ids:
+                    continue
+                if len(chunk_ids & group_chunk_ids) / len(chunk_ids) >= self.overlap_threshold:
+                    members.append(question)
+                    group_chunk_ids.update(chunk_ids)
+                    break
+            else:
+                groups.append(([question], set(chunk_ids)))
+        return [members for members, _ in groups]
+
+    def _answer_group(self, group: List[str], context: List[Document]) -> Dict[str, str]:
+        """
+        Answer a group of questions with one LLM call.
+
+        Args:
+        group (List[str]): The questions of the group
+        context (List[Document]): The documents sent as context, from _merge_context
+
+        Returns:
+        dict: Mapping of question to answer, for every answer that could be attributed
+        """
+        context = "\n\n".join(self.document_prompt.format(
+            page_content=document.page_content,
+            **{variable: document.metadata.get(variable, "N/A") for variable in self.document_prompt.input_variables if variable != "page_content"}
+        ) for document in context)
+        numbered = "\n".join(f"{number}. {question}" for number, question in enumerate(group, start=1))
+        try:
+            response = self.llm.invoke(MULTI_QUESTION_PROMPT.format(context=context, questions=numbered))
+            return self._parse_answers(response.content, group)
+        except Exception as e:
+            logger.error(f"Error answering batched questions: {e}")
+            return {}
+
+    def _merge_context(self, group: List[str], retrieved: Dict[str, List[Document]]) -> List[Document]:
+        """
+        Merge the retrieved documents of a group, most shared first.
+
+        Args:
+        group (List[str]): The questions of the group
+        retrieved (dict): Mapping of question to its retrieved documents
+
+        Returns:
+        List[Document]: At most ``max_context_docs`` unique documents
+        """
+        counts: Dict[str, int] = {}
+        documents: Dict[str, Document] = {}
+        for question in group:
+            for document in retrieved[question]:
+                chunk_id = self._chunk_id(document)
+                counts[chunk_id] = counts.get(chunk_id, 0) + 1
+                documents.setdefault(chunk_id, document)
+        # Stable sort keeps retrieval order among chunks shared by the same number of questions
+        ranked = sorted(documents, key=lambda chunk_id: -counts[chunk_id])
+        return [documents[chunk_id] for chunk_id in ranked[:self.max_context_docs]]
+
+    @staticmethod
+    def _parse_answers(content: str, group: List[str]) -> Dict[str, str]:
+        """
+        Parse the JSON answers of a batched response.
+
+        Args:
+        content (str): The raw model output
+        group (List[str]): The questions, numbered from 1 in the prompt
+
+        Returns:
+        dict: Mapping of question to answer
+        """
+        # Tolerate a Markdown code fence around the JSON object
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not match:
+            logger.warning("Batched response contained no JSON object")
+            return {}
+        answers = {}
+        for item in json.loads(match.group(0)).get("answers", []):
+            try:
+                index = int(item["id"]) - 1
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(group) and isinstance(item.get("answer"), str):
+                answers[group[index]] = item["answer"]
+        return answers
+
+    @staticmethod
+    def _chunk_id(document: Document) -> str:
+        """
+        Identify a chunk by a hash of its content.
+
+        Args:
+        document (Document): The chunk
+
+        Returns:
+        str: MD5 hash of the chunk text
+        """
+        return hashlib.md5(document.page_content.encode()).hexdigest()
@@ -8,12 +8,18 @@ from langchain_community.document_loaders import PyPDFLoader
 import os
 import re
 import logging
-from typing import List, Union
-from langchain_community.embeddings import OpenAIEmbeddings
+from typing import Callable, List, Optional, Union
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from chunk_store import ChunkStore
+from dedup import collapse_near_duplicates
+from pipeline import RETRIEVER_SECTION, PipelineConfig, SOLUTION_2
+from profiling import Profiler, get_profiler
+from rate_limiter import RateLimitedOpenAIEmbeddings
+from section_index import SectionIndex
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -23,16 +29,26 @@ class PDFExtractor:
     A class for extracting and processing text from PDF files.
     """
 
-    PERSIST_DIRECTORY = 'db'
+    EMBEDDING_MODEL = "text-embedding-ada-002"
 
-    def __init__(self):
+    def __init__(self, on_index_created: Optional[Callable[[Chroma, str, ChunkStore], None]] = None,
+                 config: PipelineConfig = SOLUTION_2, profiler: Optional[Profiler] = None):
         """
-        Initialize the PDFExtractor with OpenAI embeddings.
+        Initialize the PDFExtractor with rate-limited OpenAI embeddings.
+
+        Args:
+            on_index_created (Callable): Optional hook called with the vector store, the PDF path and
+                the chunk store whenever a new index is created, e.g. to pre-warm the answer cache.
+            config (PipelineConfig): Pipeline settings for chunking, section tagging, deduplication
+                and the persist directory.
+            profiler (Profiler): Profiler sampling extraction, chunking and indexing; the process-wide one if None.
         """
-        self.openai_ef = OpenAIEmbeddings(model="text-embedding-ada-002")
+        self.openai_ef = RateLimitedOpenAIEmbeddings(model=self.EMBEDDING_MODEL, max_retries=0)
+        self.on_index_created = on_index_created
+        self.config = config
+        self.profiler = profiler or get_profiler()
 
-    @staticmethod
-    def get_pdf_text(pdf_path: str) -> List[Document]:
+    def get_pdf_text(self, pdf_path: str) -> List[Document]:
         """
         Load and split a PDF file into pages.
 
@@ -43,17 +59,17 @@ class PDFExtractor:
             List[Document]: A list of Document objects, each representing a page.
         """
         try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load_and_split()
+            with self.profiler.profile("extraction", pdf_path):
+                loader = PyPDFLoader(pdf_path)
+                pages = loader.load_and_split()
             return pages
         except Exception as e:
             logger.error(f"Error loading PDF: {e}")
             return []
 
-    @staticmethod
-    def get_text_chunks(pages: List[Document]) -> List[Document]:
+    def get_text_chunks(self, pages: List[Document]) -> List[Document]:
         """
-        Split pages into smaller text chunks and extract sections.
+        Split pages into smaller text chunks and, if configured, extract sections.
 
         Args:
             pages (List[Document]): A list of Document objects representing PDF pages.
@@ -62,19 +78,23 @@ class PDFExtractor:
             List[Document]: A list of Document objects representing text chunks.
         """
         text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=400,
+            chunk_size=self.config.chunk_size,
+            chunk_overlap=self.config.chunk_overlap,
             length_function=len
         )
         chunks = []
-        for page in pages:
-            try:
-                page_chunks = text_splitter.split_text(page.page_content)
-                for chunk in page_chunks:
-                    section = PDFExtractor.extract_section(chunk)
-                    chunks.append(Document(page_content=chunk, metadata={"page": page.metadata.get("page", "N/A"), "section": section}))
-            except Exception as e:
-                logger.error(f"Error processing page: {e}")
+        source = pages[0].metadata.get("source", "") if pages else ""
+        with self.profiler.profile("chunking", source):
+            for page in pages:
+                try:
+                    page_chunks = text_splitter.split_text(page.page_content)
+                    for chunk in page_chunks:
+                        metadata = {"page": page.metadata.get("page", "N/A"), "source": page.metadata.get("source", "N/A")}
+                        if self.config.tag_sections:
+                            metadata["section"] = PDFExtractor.extract_section(chunk)
+                        chunks.append(Document(page_content=chunk, metadata=metadata))
+                except Exception as e:
+                    logger.error(f"Error processing page: {e}")
         return chunks
 
     @staticmethod
@@ -96,6 +116,115 @@ class PDFExtractor:
             logger.error(f"Error extracting section: {e}")
         return "N/A"
 
+    @staticmethod
+    def get_pdf_id(pdf_path: str) -> str:
+        """
+        Derive the identifier under which a PDF is indexed.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            str: The file name without its ".pdf" extension.
+        """
+        return os.path.basename(pdf_path).replace('.pdf', '')
+
+    def get_persist_directory(self, pdf_path: str) -> str:
+        """
+        Return the directory in which the vector store of a PDF is persisted.
+
+        Configs that chunk, tag or deduplicate differently get different
+        directories, so that no config reuses an index built by another.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            str: The persist directory.
+        """
+        return os.path.join(self.config.persist_directory, self.config.index_fingerprint(),
+                            PDFExtractor.get_pdf_id(pdf_path))
+
+    def open_vectorstore(self, pdf_path: str) -> Optional[Chroma]:
+        """
+        Load the existing vector store of a PDF, if it has been indexed.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            Optional[Chroma]: The vector store, or None if the PDF has not been indexed yet.
+        """
+        persist_directory = self.get_persist_directory(pdf_path)
+        if not os.path.exists(persist_directory):
+            return None
+        logger.info("Loading existing vector store...")
+        return Chroma(persist_directory=persist_directory, embedding_function=self.openai_ef)
+
+    def get_chunk_store_directory(self, pdf_path: str) -> str:
+        """
+        Return the directory in which the chunk store of a PDF is written.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            str: The chunk store directory, inside the vector store's persist directory.
+        """
+        return os.path.join(self.get_persist_directory(pdf_path), "chunks")
+
+    def get_chunk_store(self, pdf_path: str) -> Optional[ChunkStore]:
+        """
+        Open the memory-mapped chunk store of an indexed PDF.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            Optional[ChunkStore]: The chunk store, or None for PDFs indexed before chunk stores existed.
+        """
+        return ChunkStore.open(self.get_chunk_store_directory(pdf_path))
+
+    def get_section_index_directory(self, pdf_path: str) -> str:
+        """
+        Return the directory in which the section index of a PDF is written.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+
+        Returns:
+            str: The section index directory, inside the vector store's persist directory.
+        """
+        return os.path.join(self.get_persist_directory(pdf_path), "sections")
+
+    def get_section_index(self, pdf_path: str, vectorstore: Optional[Chroma] = None) -> Optional[SectionIndex]:
+        """
+        Open the section index of an indexed PDF.
+
+        PDFs indexed before section indexes existed get one built from the
+        embeddings already in their vector store, without any embedding calls.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+            vectorstore (Optional[Chroma]): The PDF's vector store, used to build a missing index.
+
+        Returns:
+            Optional[SectionIndex]: The section index, or None if the config does not use section-first
+                retrieval, sections are not tagged, or the index is missing and cannot be built.
+        """
+        if not self.config.tag_sections or self.config.retriever != RETRIEVER_SECTION:
+            return None
+        directory = self.get_section_index_directory(pdf_path)
+        section_index = SectionIndex.open(directory)
+        if section_index is None and vectorstore is not None:
+            try:
+                section_index = SectionIndex.build(vectorstore)
+                section_index.write(directory)
+            except Exception as e:
+                logger.error(f"Error building section index: {e}")
+                return None
+        return section_index
+
     def get_vectorstore(self, text_chunks: List[Document], pdf_path: str) -> Chroma:
         """
         Create or load a vector store for the given text chunks.
@@ -107,34 +236,45 @@ class PDFExtractor:
         Returns:
             Chroma: A Chroma vector store object.
         """
-        pdf_id = os.path.basename(pdf_path).replace('.pdf', '')
-        persist_directory = os.path.join(self.PERSIST_DIRECTORY, pdf_id)
-        
-        if os.path.exists(persist_directory):
-            logger.info("Loading existing vector store...")
-            return Chroma(persist_directory=persist_directory, embedding_function=self.openai_ef)
+        vectorstore = self.open_vectorstore(pdf_path)
+        if vectorstore is not None:
+            return vectorstore
         
+        persist_directory = self.get_persist_directory(pdf_path)
         logger.info("Creating new vector store...")
-        unique_chunks = PDFExtractor.remove_duplicates(text_chunks)
         try:
-            vectorstore = Chroma.from_documents(
-                documents=unique_chunks,
-                embedding=self.openai_ef,
-                persist_directory=persist_directory
-            )
-            vectorstore.persist()
-            return vectorstore
+            with self.profiler.profile("indexing", pdf_path):
+                unique_chunks = PDFExtractor.remove_duplicates(text_chunks) if self.config.deduplicate else list(text_chunks)
+                for chunk_id, chunk in enumerate(unique_chunks):
+                    chunk.metadata["chunk_id"] = chunk_id
+                vectorstore = Chroma.from_documents(
+                    documents=unique_chunks,
+                    embedding=self.openai_ef,
+                    persist_directory=persist_directory
+                )
+                vectorstore.persist()
+                chunk_store = ChunkStore.write(self.get_chunk_store_directory(pdf_path), unique_chunks)
+                if self.config.tag_sections:
+                    SectionIndex.build(vectorstore).write(self.get_section_index_directory(pdf_path))
         except Exception as e:
             logger.error(f"Error creating vector store: {e}")
             return None
 
+        if self.on_index_created is not None:
+            try:
+                self.on_index_created(vectorstore, pdf_path, chunk_store)
+            except Exception as e:
+                logger.error(f"Error in index creation hook: {e}")
+        return vectorstore
+
     @staticmethod
-    def remove_duplicates(chunks: List[Union[Document, str]]) -> List[Document]:
+    def remove_duplicates(chunks: List[Union[Document, str]], near_duplicates: bool = True) -> List[Document]:
         """
         Remove duplicate chunks from the list.
 
         Args:
             chunks (List[Union[Document, str]]): A list of Document objects or strings.
+            near_duplicates (bool): Also collapse near-identical chunks, keeping all their page references.
 
         Returns:
             List[Document]: A list of unique Document objects.
@@ -151,11 +291,21 @@ class PDFExtractor:
                     logger.warning(f"Unexpected chunk type: {type(chunk)}. Skipping.")
                     continue
 
-                if content not in seen:
+                if isinstance(chunk, str):
+                    chunk = Document(page_content=chunk, metadata={})
+                if near_duplicates:
+                    # Exact duplicates are kept here so that their pages are merged below
+                    unique_chunks.append(chunk)
+                elif content not in seen:
                     seen.add(content)
-                    if isinstance(chunk, str):
-                        chunk = Document(page_content=chunk, metadata={})
                     unique_chunks.append(chunk)
             except Exception as e:
                 logger.error(f"Error processing chunk: {e}")
-        return unique_chunks
\ No newline at end of file
+
+        if near_duplicates:
+            try:
+                return collapse_near_duplicates(unique_chunks)
+            except Exception as e:
+                logger.error(f"Error collapsing near-duplicate chunks: {e}")
+                return PDFExtractor.remove_duplicates(unique_chunks, near_duplicates=False)
+        return unique_chunks
@@ -0,0 +1,134 @@
+"""
+pipeline.py: Declarative configuration of the question-answering pipeline.
+
+This module describes everything that differs between pipeline variants
+(chunking, section tagging, deduplication, retriever type, contextual
+compression and prompts) as a PipelineConfig. PDFExtractor and ChainManager
+build themselves from a config, so that both original solutions are presets
+of one code base rather than separate copies of it.
+"""
+
+import json
+import hashlib
+import logging
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Dict, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Retriever types
+RETRIEVER_MMR = "mmr"            # dense MMR search only
+RETRIEVER_ENSEMBLE = "ensemble"  # dense MMR and BM25, fused
+RETRIEVER_SECTION = "section"    # section-first ensemble; plain ensemble when there is no section index
+RETRIEVERS = (RETRIEVER_MMR, RETRIEVER_ENSEMBLE, RETRIEVER_SECTION)
+
+# Fields that change what gets indexed; configs differing in any of them get separate indexes
+INDEX_FIELDS = ("chunk_size", "chunk_overlap", "tag_sections", "deduplicate")
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """
+    Settings of one pipeline variant.
+    """
+
+    name: str
+    # Indexing
+    chunk_size: int = 2000
+    chunk_overlap: int = 400
+    tag_sections: bool = True
+    deduplicate: bool = True
+    persist_directory: str = "db"
+    # Retrieval and answering
+    retriever: str = RETRIEVER_ENSEMBLE
+    k: int = 5
+    compression: bool = True
+    context_template: str = (
+        "Given the following context:\n\n{context}\n\nAnswer the following question: {question}\n\n"
+        "If the answer is not explicitly stated in the context, try to find keywords matching. "
+        "Else, say 'Data Not Available'. Include the section number in your response when possible."
+    )
+    document_template: str = "[Section {section}] {page_content}"
+    # Answer cache namespace, keeping the answers of different variants apart
+    cache_namespace: Optional[str] = None
+
+    def __post_init__(self):
+        if self.retriever not in RETRIEVERS:
+            raise ValueError(f"Unknown retriever '{self.retriever}', expected one of {', '.join(RETRIEVERS)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the config as a JSON-serializable dictionary."""
+        return asdict(self)
+
+    def index_fingerprint(self) -> str:
+        """Return a short hash of the indexing fields, naming the index this config builds."""
+        values = json.dumps({name: getattr(self, name) for name in INDEX_FIELDS}, sort_keys=True)
+        return hashlib.sha256(values.encode("utf-8")).hexdigest()[:12]
+
+
+# The original simple pipeline: untagged chunks, MMR retrieval and compression
+SOLUTION_1 = PipelineConfig(
+    name="solution_1",
+    tag_sections=False,
+    deduplicate=False,
+    persist_directory="db_solution_1",
+    retriever=RETRIEVER_MMR,
+    context_template=(
+        "Given the following context:\n\n{context}\n\nAnswer the following question: {question}\n\n"
+        "If the answer is not explicitly stated in the context, try to find keywords matching. "
+        "Else, say 'Data Not Available'."
+    ),
+    document_template="{page_content}",
+    cache_namespace="solution_1",
+)
+
+# The advanced pipeline: section tagging, deduplication, hybrid retrieval and compression
+SOLUTION_2 = PipelineConfig(name="solution_2")
+
+# The advanced pipeline with section-first retrieval, which is opt-in
+SOLUTION_2_SECTIONS = replace(SOLUTION_2, name="solution_2_sections", retriever=RETRIEVER_SECTION,
+                              cache_namespace="solution_2_sections")
+
+PRESETS: Dict[str, PipelineConfig] = {config.name: config for config in (SOLUTION_1, SOLUTION_2, SOLUTION_2_SECTIONS)}
+
+
+def get_preset(name: str) -> PipelineConfig:
+    """
+    Return a preset by name.
+
+    Args:
+    name (str): The preset name
+
+    Returns:
+    PipelineConfig: The preset
+
+    Raises:
+    ValueError: If there is no preset with that name
+    """
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset '{name}', expected one of {', '.join(PRESETS)}")
+    return PRESETS[name]
+
+
+def load_config(path: str) -> PipelineConfig:
+    """
+    Load a config from a JSON file.
+
+    The file holds the fields to set, plus an optional "preset" naming the
+    preset the other fields override, e.g. {"preset": "solution_2", "name": "no-compression", "compression": false}.
+
+    Args:
+    path (str): Path to the JSON file
+
+    Returns:
+    PipelineConfig: The config
+    """
+    with open(path, encoding="utf-8") as config_file:
+        values = json.load(config_file)
+    base = get_preset(values.pop("preset", SOLUTION_2.name))
+    unknown = set(values) - {field.name for field in fields(PipelineConfig)}
+    if unknown:
+        raise ValueError(f"Unknown config fields: {', '.join(sorted(unknown))}")
+    return replace(base, **values)
@@ -0,0 +1,179 @@
+"""
+prewarm.py: Background pre-warming of the answer cache.
+
+This module answers a known question set in the background as soon as a new
+document is indexed, so that interactive users hit the cache from the first
+minute. Warming runs with bounded concurrency and yields to live traffic on
+the same cache namespace: before each question it waits until no live request
+on that namespace is in flight. Live
+requests in turn wait for a question that is already being warmed instead of
+paying for it a second time.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TrafficGate:
+    """
+    Tracks live requests and warmed questions, so that warming yields to live
+    requests and live requests can wait for a question already being warmed.
+    """
+
+    def __init__(self):
+        """Initialize the TrafficGate with no live requests."""
+        self._active = 0
+        self._warming = set()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def live(self):
+        """Mark a live request as in flight for the duration of the block."""
+        with self._condition:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def wait_until_idle(self):
+        """Block until no live request is in flight."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._active == 0)
+
+    @contextmanager
+    def warming(self, key: Hashable):
+        """
+        Wait until no live request is in flight, then mark a question as being warmed for the block.
+
+        Args:
+        key (Hashable): Key of the question, as passed to is_warming and wait_for_warming
+        """
+        with self._condition:
+            # Checked and marked under one lock, so no warm starts while a live request is in flight
+            self._condition.wait_for(lambda: self._active == 0)
+            self._warming.add(key)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._warming.discard(key)
+                self._condition.notify_all()
+
+    def is_warming(self, key: Hashable) -> bool:
+        """Return True if the question with this key is being warmed."""
+        with self._condition:
+            return key in self._warming
+
+    def wait_for_warming(self, keys: Iterable[Hashable], timeout: Optional[float] = None) -> bool:
+        """
+        Block until none of the given questions is being warmed.
+
+        Args:
+        keys (Iterable): Keys of the questions
+        timeout (float): Maximum number of seconds to wait
+
+        Returns:
+        bool: False if the timeout expired first
+        """
+        keys = set(keys)
+        with self._condition:
+            return self._condition.wait_for(lambda: not keys & self._warming, timeout)
+
+
+_traffic_gates: Dict[Optional[str], TrafficGate] = {}
+_traffic_gates_lock = threading.Lock()
+
+
+def get_traffic_gate(namespace: Optional[str] = None) -> TrafficGate:
+    """
+    Return the process-wide TrafficGate of a cache namespace.
+
+    Live traffic on one namespace, e.g. one document, does not hold up
+    warming of the others.
+
+    Args:
+    namespace (str): The answer cache namespace
+
+    Returns:
+    TrafficGate: The gate shared by live traffic and cache warmers of that namespace
+    """
+    with _traffic_gates_lock:
+        if namespace not in _traffic_gates:
+            _traffic_gates[namespace] = TrafficGate()
+        return _traffic_gates[namespace]
+
+
+class CacheWarmer:
+    """
+    Answers a question set in the background at low priority.
+    """
+
+    def __init__(self, questions: List[str], answer_fn: Callable[[str], None], max_workers: int = 2,
+                 gate: Optional[TrafficGate] = None, key_fn: Callable[[str], Hashable] = lambda question: question):
+        """
+        Initialize the CacheWarmer.
+
+        Args:
+        questions (List[str]): The questions to pre-answer
+        answer_fn (Callable): Answers one question and stores the result in the cache
+        max_workers (int): Maximum number of questions answered concurrently
+        gate (TrafficGate): Gate used to yield to live traffic; the process-wide gate if None
+        key_fn (Callable): Maps a question to the key live requests look it up by on the gate
+        """
+        self.questions = questions
+        self.answer_fn = answer_fn
+        self.max_workers = max_workers
+        self.gate = gate or get_traffic_gate()
+        self.key_fn = key_fn
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> threading.Thread:
+        """
+        Start warming in a background daemon thread.
+
+        Returns:
+        threading.Thread: The warming thread
+        """
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        Wait for warming to finish.
+
+        Args:
+        timeout (float): Maximum number of seconds to wait
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Answer every question with bounded concurrency."""
+        logger.info(f"Pre-warming the cache with {len(self.questions)} questions")
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cache-warmer") as executor:
+            list(executor.map(self._warm, self.questions))
+        logger.info("Cache pre-warming finished")
+
+    def _warm(self, question: str):
+        """
+        Answer one question once live traffic is idle.
+
+        Args:
+        question (str): The question to pre-answer
+        """
+        try:
+            with self.gate.warming(self.key_fn(question)):
+                self.answer_fn(question)
+        except Exception as e:
+            logger.error(f"Error pre-warming question '{question}': {e}")
@@ -0,0 +1,316 @@
+"""
+profiling.py: Opt-in profiling of individual questions and ingestions.
+
+This module profiles a configurable fraction of requests and writes one set of
+files per profiled request to a directory: wall-clock stack samples in
+collapsed-stack format (one "frame;frame;frame count" line per stack, ready for
+flamegraph.pl or speedscope), a top-N table of cumulative time and, with
+deterministic profiling, the raw cProfile data. Stacks are sampled from the
+requesting thread and from worker threads while they run work the request
+handed them through propagate(), not from other requests or idle pools.
+Requests that are not selected only pay for one random draw, and nothing at
+all is done while the sample rate is zero, which is the default.
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import hashlib
+import itertools
+import cProfile
+import logging
+import pstats
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional, Set
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# The profile session of the request each thread is working for, if it is profiled
+_current = threading.local()
+
+
+class StackSampler:
+    """
+    Samples the stacks of a set of threads, or of all threads, at a fixed interval.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Set[int]] = None):
+        """
+        Initialize the StackSampler.
+
+        Args:
+        interval (float): Seconds between samples
+        thread_ids (set): Idents of the threads to sample, which may change while sampling; all threads if None
+        """
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling in a background daemon thread."""
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """
+        Return the samples in collapsed-stack format.
+
+        Returns:
+        str: One "thread;outermost;...;innermost count" line per distinct stack
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, top_n: int) -> str:
+        """
+        Return a table of the functions present in the most samples.
+
+        Args:
+        top_n (int): Number of functions listed
+
+        Returns:
+        str: The table, with inclusive (cumulative) and exclusive (self) sample counts
+        """
+        cumulative: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            for frame in set(frames):
+                cumulative[frame] += count
+            if frames:
+                own[frames[-1]] += count
+        lines = [f"{self.samples} samples every {self.interval * 1000:g} ms\n",
+                 f"{'cumulative':>10} {'%':>6} {'self':>8}  function"]
+        for frame, count in cumulative.most_common(top_n):
+            lines.append(f"{count:>10} {100.0 * count / max(1, self.samples):>6.1f} {own[frame]:>8}  {frame}")
+        return "\n".join(lines) + "\n"
+
+    def _run(self):
+        """Take samples until stopped."""
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            thread_ids = None if self.thread_ids is None else set(self.thread_ids)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (thread_ids is not None and thread_id not in thread_ids):
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+
+class _ProfileSession:
+    """
+    Profiles one request and writes its files on exit.
+    """
+
+    def __init__(self, profiler: "Profiler", kind: str, label: str):
+        self.profiler = profiler
+        self.kind = kind
+        self.label = label
+        self.thread_ids: Set[int] = set()
+        self._lock = threading.Lock()
+        self.sampler = StackSampler(profiler.interval, self.thread_ids)
+        self.deterministic = cProfile.Profile() if profiler.deterministic else None
+
+    def attach(self):
+        """Sample the calling thread as part of this request until detach is called."""
+        with self._lock:
+            self.thread_ids.add(threading.get_ident())
+        previous = getattr(_current, "session", None)
+        _current.session = self
+        return previous
+
+    def detach(self, previous=None):
+        """Stop sampling the calling thread and restore the session it was working for before."""
+        with self._lock:
+            self.thread_ids.discard(threading.get_ident())
+        _current.session = previous
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._previous = self.attach()
+        self.sampler.start()
+        if self.deterministic is not None:
+            try:
+                self.deterministic.enable()
+            except ValueError:
+                # Only one deterministic profiler can be active at a time; keep the stack samples
+                self.deterministic = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.deterministic is not None:
+            self.deterministic.disable()
+        self.sampler.stop()
+        self.detach(self._previous)
+        try:
+            self.profiler.write(self)
+        except Exception as e:
+            logger.error(f"Error writing profile of {self.kind} '{self.label}': {e}")
+        return False
+
+
+class Profiler:
+    """
+    Profiles a random fraction of requests and writes per-request profiles to a directory.
+    """
+
+    def __init__(self, output_dir: str = "profiles", sample_rate: float = 0.0, deterministic: bool = True,
+                 interval: float = 0.005, top_n: int = 30, rng: Callable[[], float] = random.random):
+        """
+        Initialize the Profiler.
+
+        Args:
+        output_dir (str): Directory the profiles are written to
+        sample_rate (float): Fraction of requests profiled, from 0 (off) to 1 (all)
+        deterministic (bool): Also run cProfile in the requesting thread; stack samples are always taken
+        interval (float): Seconds between stack samples
+        top_n (int): Number of functions in the cumulative table
+        rng (Callable): Source of uniform random numbers in [0, 1)
+        """
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.deterministic = deterministic
+        self.interval = interval
+        self.top_n = top_n
+        self.rng = rng
+        self._sequence = itertools.count()
+
+    def profile(self, kind: str, label: str = ""):
+        """
+        Return a context manager profiling the enclosed request if it is selected.
+
+        Args:
+        kind (str): Kind of request, e.g. "question" or "indexing", used in file names
+        label (str): The question or document, recorded in the profile
+
+        Returns:
+        A context manager; a no-op one for requests that are not profiled
+        """
+        if self.sample_rate <= 0 or self.rng() >= self.sample_rate:
+            return nullcontext()
+        return _ProfileSession(self, kind, label)
+
+    def write(self, session: _ProfileSession) -> Dict[str, str]:
+        """
+        Write the files of a finished profile session.
+
+        Args:
+        session (_ProfileSession): The finished session
+
+        Returns:
+        dict: Paths of the written files by format
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        elapsed = time.perf_counter() - session.started
+        digest = hashlib.md5(session.label.encode()).hexdigest()[:8]
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sequence)}-{session.kind}-{digest}")
+        paths = {"collapsed": f"{base}.collapsed", "top": f"{base}.txt"}
+
+        with open(paths["collapsed"], "w", encoding="utf-8") as collapsed:
+            collapsed.write(session.sampler.collapsed())
+        with open(paths["top"], "w", encoding="utf-8") as top:
+            top.write(f"{session.kind}: {session.label}\nwall time: {elapsed:.3f}s\n\n")
+            top.write(session.sampler.top(self.top_n))
+            if session.deterministic is not None:
+                stream = io.StringIO()
+                stats = pstats.Stats(session.deterministic, stream=stream)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+                top.write("\ncProfile, requesting thread only:\n")
+                top.write(stream.getvalue())
+        if session.deterministic is not None:
+            paths["pstats"] = f"{base}.prof"
+            session.deterministic.dump_stats(paths["pstats"])
+
+        logger.info(f"Profiled {session.kind} '{session.label}' in {elapsed:.2f}s: {paths['collapsed']}")
+        return paths
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Wrap a callable handed to another thread so that thread is profiled with the current request.
+
+    Args:
+    fn (Callable): The work to run in another thread
+
+    Returns:
+    Callable: fn itself if the current request is not profiled, else a wrapper that samples
+    the thread running it while it runs
+    """
+    session = getattr(_current, "session", None)
+    if session is None:
+        return fn
+
+    def run(*args, **kwargs):
+        if getattr(_current, "session", None) is session:
+            # Run in the thread that is already being profiled
+            return fn(*args, **kwargs)
+        previous = session.attach()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            session.detach(previous)
+
+    return run
+
+
+_profiler: Optional[Profiler] = None
+_profiler_lock = threading.Lock()
+
+
+def configure_profiler(**kwargs) -> Profiler:
+    """
+    Set the process-wide profiler.
+
+    Args:
+    **kwargs: Keyword arguments of Profiler
+
+    Returns:
+    Profiler: The profiler now in use
+    """
+    global _profiler
+    with _profiler_lock:
+        _profiler = Profiler(**kwargs)
+        return _profiler
+
+
+def get_profiler() -> Profiler:
+    """
+    Return the process-wide profiler, creating it on first use.
+
+    Profiling is off unless the ``QA_PROFILE_RATE`` environment variable sets
+    the fraction of requests to profile. ``QA_PROFILE_DIR`` sets the output
+    directory and ``QA_PROFILE_MODE=sample`` skips cProfile.
+
+    Returns:
+    Profiler: The profiler shared by question answering and ingestion
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler(
+                output_dir=os.getenv("QA_PROFILE_DIR", "profiles"),
+                sample_rate=float(os.getenv("QA_PROFILE_RATE", 0.0)),
+                deterministic=os.getenv("QA_PROFILE_MODE", "deterministic") != "sample"
+            )
+        return _profiler
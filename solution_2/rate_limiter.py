@@ -0,0 +1,360 @@
+"""
+rate_limiter.py: Process-wide rate limiting of OpenAI calls.
+
+This module provides token-bucket rate limiters that admit OpenAI requests
+against requests-per-minute (RPM) and tokens-per-minute (TPM) quotas, using
+tiktoken to estimate the token cost of each call before it is sent. Throttled
+calls are retried with jittered exponential backoff, and every caller pauses
+while a throttling back-off is in effect, so that the embedding, compression
+and generation calls share one quota without collapsing into retry storms.
+"""
+
+import os
+import time
+import random
+import functools
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+import tiktoken
+from langchain_community.chat_models import ChatOpenAI
+from langchain_community.embeddings import OpenAIEmbeddings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Exceptions signalling that OpenAI throttled the request (openai>=1 and legacy clients)
+THROTTLING_ERRORS: Tuple[type, ...] = tuple(
+    error for error in (
+        getattr(openai, "RateLimitError", None),
+        getattr(getattr(openai, "error", None), "RateLimitError", None),
+    ) if isinstance(error, type)
+)
+
+# Default (RPM, TPM) quotas; override per model with configure_rate_limiter
+DEFAULT_CHAT_LIMITS = (3500, 90000)
+DEFAULT_EMBEDDING_LIMITS = (3000, 1000000)
+
+# Tokens reserved for the completion when a chat call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously up to its capacity.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, now: float):
+        """
+        Initialize the TokenBucket, full.
+
+        Args:
+        capacity (float): Maximum number of tokens in the bucket
+        refill_per_second (float): Tokens added per second
+        now (float): Current clock reading
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        """Add the tokens accrued since the last update."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Return the seconds until ``amount`` tokens are available."""
+        return max(0.0, (amount - self.tokens) / self.refill_per_second)
+
+    def consume(self, amount: float):
+        """Take ``amount`` tokens out of the bucket."""
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Admits requests against RPM and TPM token buckets and retries throttled calls.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize the RateLimiter.
+
+        Args:
+        rpm (int): Requests allowed per minute
+        tpm (int): Tokens allowed per minute
+        max_retries (int): Maximum number of retries of a throttled call
+        base_delay (float): Back-off delay before the first retry, in seconds
+        max_delay (float): Upper bound of the back-off delay, in seconds
+        clock (Callable): Monotonic clock returning seconds
+        sleep (Callable): Function used to wait
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        self.requests = TokenBucket(rpm, rpm / 60.0, now)
+        self.tokens = TokenBucket(tpm, tpm / 60.0, now)
+        self.paused_until = now
+        # Held by the request at the head of the queue while it waits for capacity
+        self._admission = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "throttled": 0, "retries": 0, "queue_wait_total": 0.0, "queue_wait_max": 0.0}
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Block until one request costing ``tokens`` tokens fits within both quotas.
+
+        Args:
+        tokens (int): Estimated token cost of the request
+
+        Returns:
+        float: Seconds spent waiting in the queue
+        """
+        start = self.clock()
+        # A single request larger than the whole TPM quota is admitted once the bucket is full
+        tokens = min(tokens, self.tokens.capacity)
+        with self._admission:
+            while True:
+                with self._lock:
+                    now = self.clock()
+                    self.requests.refill(now)
+                    self.tokens.refill(now)
+                    wait = max(self.paused_until - now, self.requests.time_until(1), self.tokens.time_until(tokens))
+                    if wait <= 0:
+                        self.requests.consume(1)
+                        self.tokens.consume(tokens)
+                        waited = now - start
+                        self._stats["admitted"] += 1
+                        self._stats["queue_wait_total"] += waited
+                        self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], waited)
+                        return waited
+                self.sleep(wait)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """
+        Admit one request costing ``tokens`` tokens only if it fits within both quotas right now.
+
+        Args:
+        tokens (int): Estimated token cost of the request
+
+        Returns:
+        bool: True if the request was admitted, False if it would have to queue
+        """
+        tokens = min(tokens, self.tokens.capacity)
+        # Requests already queued for admission go first
+        if not self._admission.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                now = self.clock()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                if max(self.paused_until - now, self.requests.time_until(1), self.tokens.time_until(tokens)) > 0:
+                    return False
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                self._stats["admitted"] += 1
+                return True
+        finally:
+            self._admission.release()
+
+    def pause(self, delay: float):
+        """
+        Stop admitting requests for ``delay`` seconds, e.g. after being throttled.
+
+        Args:
+        delay (float): Seconds to pause for
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + delay)
+
+    def call(self, fn: Callable[[], Any], tokens: int) -> Any:
+        """
+        Run a call once admitted, retrying with jittered backoff when throttled.
+
+        Args:
+        fn (Callable): The call to make
+        tokens (int): Estimated token cost of the call
+
+        Returns:
+        Any: The return value of ``fn``
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                return fn()
+            except THROTTLING_ERRORS as e:
+                with self._lock:
+                    self._stats["throttled"] += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"OpenAI rate limit hit, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                # Pause every caller, not just this one, so that retries do not stampede the quota
+                self.pause(delay)
+                with self._lock:
+                    self._stats["retries"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return admission, throttling and queue-wait metrics.
+
+        Returns:
+        dict: Counters and queue-wait times in seconds
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_wait_avg"] = stats["queue_wait_total"] / stats["admitted"] if stats["admitted"] else 0.0
+        return stats
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """
+        Read the server-suggested delay from a throttling error, if any.
+
+        Args:
+        error (Exception): The throttling error
+
+        Returns:
+        float or None: Seconds to wait, or None if the server did not say
+        """
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limiter(model: str, rpm: int, tpm: int) -> RateLimiter:
+    """
+    Set the process-wide quota for a model.
+
+    Args:
+    model (str): The OpenAI model name
+    rpm (int): Requests allowed per minute
+    tpm (int): Tokens allowed per minute
+
+    Returns:
+    RateLimiter: The limiter now used for the model
+    """
+    with _limiters_lock:
+        _limiters[model] = RateLimiter(rpm, tpm)
+        return _limiters[model]
+
+
+def get_rate_limiter(model: str, default_limits: Tuple[int, int] = DEFAULT_CHAT_LIMITS) -> RateLimiter:
+    """
+    Return the process-wide limiter of a model, creating it on first use.
+
+    The quota can be set with the ``OPENAI_RPM_LIMIT`` and ``OPENAI_TPM_LIMIT``
+    environment variables, or per model with configure_rate_limiter.
+
+    Args:
+    model (str): The OpenAI model name
+    default_limits (tuple): (RPM, TPM) used when nothing is configured
+
+    Returns:
+    RateLimiter: The limiter shared by all calls to the model
+    """
+    with _limiters_lock:
+        if model not in _limiters:
+            rpm = int(os.getenv("OPENAI_RPM_LIMIT", default_limits[0]))
+            tpm = int(os.getenv("OPENAI_TPM_LIMIT", default_limits[1]))
+            _limiters[model] = RateLimiter(rpm, tpm)
+        return _limiters[model]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """
+    Load the tiktoken encoding of a model.
+
+    Args:
+    model (str): The OpenAI model name
+
+    Returns:
+    Encoding or None: The encoding, or None if it could not be loaded
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model}, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(texts: List[str], model: str) -> int:
+    """
+    Estimate the number of tokens in a list of texts with tiktoken.
+
+    Args:
+    texts (list): The texts to count
+    model (str): The OpenAI model name, used to select the encoding
+
+    Returns:
+    int: The total token count
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Roughly 4 characters per token for English text
+        return sum(len(text) // 4 + 1 for text in texts)
+    return sum(len(encoding.encode(text, disallowed_special=())) for text in texts)
+
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose requests go through the process-wide rate limiter of its model.
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        """Estimate the call's token cost, wait for admission and generate with retries."""
+        texts = [message.content if isinstance(message.content, str) else str(message.content) for message in messages]
+        # Roughly 4 tokens of framing per message, plus the completion budget
+        tokens = count_tokens(texts, self.model_name) + 4 * len(messages) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+        limiter = get_rate_limiter(self.model_name, DEFAULT_CHAT_LIMITS)
+        return limiter.call(lambda: super(RateLimitedChatOpenAI, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs), tokens)
+
+
+class RateLimitedOpenAIEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings whose requests go through the process-wide rate limiter of its model.
+    """
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = 0) -> List[List[float]]:
+        """Embed texts in batches sized to the TPM quota, waiting for admission before each batch."""
+        limiter = get_rate_limiter(self.model, DEFAULT_EMBEDDING_LIMITS)
+        max_batch_tokens = max(1, int(limiter.tokens.capacity // 10))
+        embeddings: List[List[float]] = []
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            text_tokens = count_tokens([text], self.model)
+            if batch and (batch_tokens + text_tokens > max_batch_tokens or len(batch) >= self.chunk_size):
+                embeddings.extend(self._embed_batch(limiter, batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += text_tokens
+        if batch:
+            embeddings.extend(self._embed_batch(limiter, batch, batch_tokens))
+        return embeddings
+
+    def _embed_batch(self, limiter: RateLimiter, batch: List[str], tokens: int) -> List[List[float]]:
+        """Embed one batch once admitted by the limiter."""
+        return limiter.call(lambda: super(RateLimitedOpenAIEmbeddings, self).embed_documents(batch), tokens)
@@ -0,0 +1,193 @@
+"""
+section_index.py: Coarse-to-fine retrieval over the section structure of a document.
+
+This module stores one representative embedding per section, the normalized
+centroid of the section's chunk embeddings, next to the vector store at index
+time. SectionRetriever first ranks these centroids against the query and then
+searches chunks only inside the best sections, so that large manuals yield a
+smaller, more focused candidate set and fewer contextual compression calls.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from chunk_store import ChunkStore
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class SectionIndex:
+    """
+    Section-level representatives of one document: one centroid embedding per section.
+    """
+
+    CENTROIDS_FILE = "centroids.npy"
+    SECTIONS_FILE = "sections.json"
+
+    def __init__(self, sections: List[str], centroids: np.ndarray, counts: List[int]):
+        """
+        Initialize the SectionIndex.
+
+        Args:
+        sections (List[str]): The section names, as tagged in chunk metadata
+        centroids (np.ndarray): One unit-length centroid embedding per section
+        counts (List[int]): Number of chunks in each section
+        """
+        self.sections = sections
+        self.centroids = centroids
+        self.counts = counts
+
+    @classmethod
+    def build(cls, vectorstore) -> "SectionIndex":
+        """
+        Build the index from the chunk embeddings already stored in a vector store.
+
+        Args:
+        vectorstore: The Chroma vector store of the document
+
+        Returns:
+        SectionIndex: The index
+        """
+        data = vectorstore.get(include=["embeddings", "metadatas"])
+        members: Dict[str, List[int]] = {}
+        for position, metadata in enumerate(data["metadatas"]):
+            section = str((metadata or {}).get("section", "N/A"))
+            members.setdefault(section, []).append(position)
+
+        embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+        if not len(members):
+            return cls([], np.zeros((0, 0), dtype=np.float32), [])
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        sections = sorted(members)
+        centroids = np.stack([embeddings[members[section]].mean(axis=0) for section in sections])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        logger.info(f"Built section index with {len(sections)} sections over {len(embeddings)} chunks")
+        return cls(sections, centroids, [len(members[section]) for section in sections])
+
+    def write(self, directory: str):
+        """
+        Write the index to a directory.
+
+        Args:
+        directory (str): Directory to write the index files to
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.CENTROIDS_FILE), self.centroids)
+        # Written last: an index without its sections file is treated as missing
+        with open(os.path.join(directory, self.SECTIONS_FILE), "w", encoding="utf-8") as sections_file:
+            json.dump({"sections": self.sections, "counts": self.counts}, sections_file)
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["SectionIndex"]:
+        """
+        Open the index in a directory, if there is one.
+
+        Args:
+        directory (str): Directory holding the index files
+
+        Returns:
+        SectionIndex or None: The index, or None if it is missing or unreadable
+        """
+        if not os.path.exists(os.path.join(directory, cls.SECTIONS_FILE)):
+            return None
+        try:
+            with open(os.path.join(directory, cls.SECTIONS_FILE), encoding="utf-8") as sections_file:
+                tables = json.load(sections_file)
+            centroids = np.load(os.path.join(directory, cls.CENTROIDS_FILE))
+            return cls(tables["sections"], centroids, tables["counts"])
+        except Exception as e:
+            logger.error(f"Error opening section index in '{directory}': {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def rank(self, embedding: List[float], top_n: int) -> List[str]:
+        """
+        Rank sections by cosine similarity of their centroid to a query embedding.
+
+        Args:
+        embedding (List[float]): The query embedding
+        top_n (int): Number of sections to return
+
+        Returns:
+        List[str]: The best sections, most similar first
+        """
+        if not self.sections:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.centroids @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        return [self.sections[index] for index in np.argsort(-scores, kind="stable")[:top_n]]
+
+
+class SectionRetriever(BaseRetriever):
+    """
+    Two-stage retriever: ranks sections by their centroid, then searches chunks inside the top sections.
+
+    Dense results come from an MMR search restricted to the top sections. An
+    optional sparse retriever, which should return ``fetch_k`` documents, is
+    filtered to the same sections, and both rankings are combined with
+    reciprocal rank fusion, as in the flat ensemble retriever. With a chunk
+    store, dense hits are resolved through it by chunk id.
+
+    Section tags come from the first section-like number in a chunk, so
+    routing can pick the wrong sections. With a fallback retriever, a query is
+    answered by it instead when the chunk closest to the query lies outside
+    the top sections, or when the top sections yield fewer than ``min_hits``
+    chunks.
+    """
+
+    vectorstore: object
+    section_index: SectionIndex
+    sparse_retriever: Optional[BaseRetriever] = None
+    chunk_store: Optional[ChunkStore] = None
+    fallback_retriever: Optional[BaseRetriever] = None
+    k: int = 5
+    min_hits: Optional[int] = None
+    top_sections: int = 3
+    fetch_k: int = 20
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        """Rank sections, then retrieve and fuse chunks from the top sections."""
+        # The query is embedded once and reused by both stages
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        sections = self.section_index.rank(embedding, self.top_sections)
+        where = {"section": {"$in": sections}} if len(self.section_index) > self.top_sections else None
+        logger.info(f"Searching sections {sections} of {len(self.section_index)}")
+        if where is not None and self.fallback_retriever is not None:
+            closest = self.vectorstore.similarity_search_by_vector(embedding, k=1)
+            if closest and str(closest[0].metadata.get("section", "N/A")) not in sections:
+                logger.info("Closest chunk lies outside the top sections, using the fallback retriever")
+                return self.fallback_retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
+
+        dense = self.vectorstore.max_marginal_relevance_search_by_vector(
+            embedding, k=self.k, fetch_k=self.fetch_k, filter=where)
+        if self.chunk_store is not None:
+            dense = [self.chunk_store.document(document.metadata["chunk_id"]) for document in dense]
+        sparse: List[Document] = []
+        if self.sparse_retriever is not None:
+            sparse = [document for document in self.sparse_retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
+                      if where is None or str(document.metadata.get("section", "N/A")) in sections][:self.k]
+
+        # Reciprocal rank fusion with equal weights
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+        for ranking in (dense, sparse):
+            for rank, document in enumerate(ranking):
+                scores[document.page_content] = scores.get(document.page_content, 0.0) + 0.5 / (60 + rank)
+                documents.setdefault(document.page_content, document)
+        ranked = sorted(scores, key=lambda content: -scores[content])
+        min_hits = self.k if self.min_hits is None else self.min_hits
+        if where is not None and self.fallback_retriever is not None and len(ranked) < min_hits:
+            logger.info(f"Top sections yielded {len(ranked)} chunks, using the fallback retriever")
+            return self.fallback_retriever.get_relevant_documents(query, callbacks=run_manager.get_child())
+        return [documents[content] for content in ranked[:self.k]]
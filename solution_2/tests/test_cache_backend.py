@@ -0,0 +1,91 @@
+"""
+Tests of RespCacheBackend round trips against InProcessRespServer.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_backend  # noqa: E402
+from cache_backend import InProcessRespServer, RespCacheBackend  # noqa: E402
+from cache_manager import CacheManager  # noqa: E402
+
+
+class RecordingRespServer(InProcessRespServer):
+    """An InProcessRespServer that records the name of every command it executes."""
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def execute(self, name, args):
+        self.commands.append(name)
+        return super().execute(name, args)
+
+
+class RespCacheBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RecordingRespServer().start()
+        self.addCleanup(self.server.stop)
+        self.backend = RespCacheBackend.from_url(self.server.url)
+        self.addCleanup(self.backend.close)
+        self.round_trips = 0
+        pipeline = cache_backend._RespConnection.pipeline
+
+        def counted(connection, commands):
+            self.round_trips += 1
+            return pipeline(connection, commands)
+
+        cache_backend._RespConnection.pipeline = counted
+        self.addCleanup(setattr, cache_backend._RespConnection, "pipeline", pipeline)
+
+    def test_set_many_pipelines_one_set_per_entry(self):
+        self.backend.set_many({"a": {"answer": "1"}, "b": {"answer": "2"}, "c": {"answer": "3"}})
+        self.assertEqual(self.round_trips, 1)
+        self.assertEqual(self.server.commands, ["SET", "SET", "SET"])
+
+    def test_get_many_is_one_mget(self):
+        self.backend.set_many({"a": {"answer": "1"}, "c": {"answer": "3"}})
+        self.server.commands.clear()
+        self.round_trips = 0
+
+        entries = self.backend.get_many(["a", "b", "c"])
+
+        self.assertEqual(entries, [{"answer": "1"}, None, {"answer": "3"}])
+        self.assertEqual(self.round_trips, 1)
+        self.assertEqual(self.server.commands, ["MGET"])
+
+    def test_empty_calls_skip_the_server(self):
+        self.assertEqual(self.backend.get_many([]), [])
+        self.backend.set_many({})
+        self.assertEqual(self.server.commands, [])
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.backend.get_many(["a"])
+        self.assertEqual(self.backend._idle.qsize(), 1)
+
+    def test_ttl_is_sent_with_each_set(self):
+        backend = RespCacheBackend.from_url(self.server.url, ttl=60)
+        self.addCleanup(backend.close)
+        backend.set_many({"a": {"answer": "1"}})
+        self.assertIn(b"qa_cache:a", self.server._expiry)
+
+    def test_cache_manager_looks_up_a_question_list_in_one_round_trip(self):
+        cache = CacheManager(namespace="doc", backend=self.backend)
+        cache.cache_answers({"Who is the CEO?": ("Shruti", ["p1"]), "What is the name?": ("Zania", ["p2"])})
+        self.round_trips = 0
+
+        answers = cache.get_cached_answers(["Who is the CEO?", "What is the name?", "Unknown?"])
+
+        self.assertEqual(self.round_trips, 1)
+        self.assertEqual(answers["Who is the CEO?"], {"answer": "Shruti", "sources": ["p1"]})
+        self.assertEqual(answers["What is the name?"], {"answer": "Zania", "sources": ["p2"]})
+        self.assertIsNone(answers["Unknown?"])
+
+
+if __name__ == "__main__":
+    unittest.main()
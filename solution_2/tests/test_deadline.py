@@ -0,0 +1,125 @@
+"""
+Tests of the per-tier latency estimates of DegradationScheduler and of TieredChain timeouts.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadline import (  # noqa: E402
+    TIER_FULL,
+    TIER_NO_COMPRESSION,
+    TIER_REDUCED_K,
+    TIER_RETRIEVAL_ONLY,
+    DegradationScheduler,
+    TieredChain,
+)
+
+
+def answer(result):
+    return {"result": result, "source_documents": []}
+
+
+class DegradationSchedulerTest(unittest.TestCase):
+
+    def test_first_observation_replaces_the_initial_estimate(self):
+        scheduler = DegradationScheduler({TIER_FULL: 8.0}, alpha=0.5)
+        scheduler.record(TIER_FULL, 1.0)
+        self.assertEqual(scheduler.estimate(TIER_FULL), 1.0)
+
+    def test_later_observations_are_averaged(self):
+        scheduler = DegradationScheduler(alpha=0.5)
+        scheduler.record(TIER_FULL, 1.0)
+        scheduler.record(TIER_FULL, 3.0)
+        self.assertAlmostEqual(scheduler.estimate(TIER_FULL), 2.0)
+
+    def test_timeout_only_raises_the_estimate(self):
+        scheduler = DegradationScheduler({TIER_FULL: 2.0})
+        scheduler.record_timeout(TIER_FULL, 1.0)
+        self.assertEqual(scheduler.estimate(TIER_FULL), 2.0)
+        scheduler.record_timeout(TIER_FULL, 3.0)
+        self.assertEqual(scheduler.estimate(TIER_FULL), 3.0)
+
+    def test_chooses_the_most_complete_tier_that_fits(self):
+        scheduler = DegradationScheduler({TIER_FULL: 1.0}, safety_margin=1.0)
+        self.assertEqual(scheduler.choose(1.5), TIER_FULL)
+
+    def test_probes_a_skipped_tier_once_then_every_probe_every_choices(self):
+        scheduler = DegradationScheduler({TIER_FULL: 4.0, TIER_NO_COMPRESSION: 1.0}, safety_margin=1.0, probe_every=3)
+        choices = [scheduler.choose(2.0) for _ in range(4)]
+        self.assertEqual(choices, [TIER_FULL, TIER_NO_COMPRESSION, TIER_FULL, TIER_NO_COMPRESSION])
+
+    def test_does_not_probe_a_tier_far_over_the_budget(self):
+        scheduler = DegradationScheduler({TIER_FULL: 10.0, TIER_NO_COMPRESSION: 1.0}, safety_margin=1.0,
+                                         max_probe_ratio=3.0)
+        self.assertEqual(scheduler.choose(2.0), TIER_NO_COMPRESSION)
+
+    def test_a_faster_observation_brings_a_tier_back(self):
+        scheduler = DegradationScheduler({TIER_FULL: 4.0, TIER_NO_COMPRESSION: 1.0, TIER_REDUCED_K: 0.5},
+                                         safety_margin=1.0)
+        self.assertEqual(scheduler.choose(2.0), TIER_FULL)  # probe
+        scheduler.record(TIER_FULL, 1.5)
+        self.assertEqual(scheduler.choose(2.0), TIER_FULL)
+
+
+class TieredChainTest(unittest.TestCase):
+
+    def test_abandoned_call_records_its_real_latency(self):
+        release = threading.Event()
+        finished = threading.Event()
+        now = [0.0]
+        scheduler = DegradationScheduler({TIER_FULL: 0.1, TIER_RETRIEVAL_ONLY: 0.0})
+        recorded = []
+        record = scheduler.record
+
+        def record_and_signal(tier, elapsed):
+            record(tier, elapsed)
+            recorded.append((tier, elapsed))
+            if tier == TIER_FULL:
+                finished.set()
+
+        scheduler.record = record_and_signal
+
+        def full(query):
+            release.wait(5)
+            now[0] += 10.0
+            return answer("full")
+
+        chain = TieredChain({TIER_FULL: full, TIER_RETRIEVAL_ONLY: lambda query: answer("excerpt")},
+                            scheduler=scheduler, clock=lambda: now[0])
+        _, _, tier = chain.run("question", budget=0.05)
+        self.assertEqual(tier, TIER_RETRIEVAL_ONLY)
+        self.assertEqual(chain.abandoned(), 1)
+
+        release.set()
+        self.assertTrue(finished.wait(5))
+        self.assertIn((TIER_FULL, 10.0), recorded)
+        self.assertEqual(scheduler.estimate(TIER_FULL), 10.0)
+        self.assertEqual(chain.abandoned(), 0)
+
+    def test_caps_abandoned_calls(self):
+        release = threading.Event()
+        started = []
+        scheduler = DegradationScheduler({TIER_FULL: 0.0, TIER_RETRIEVAL_ONLY: 0.0})
+        scheduler.record_timeout = lambda tier, elapsed: None
+
+        def full(query):
+            started.append(query)
+            release.wait(5)
+            return answer("full")
+
+        chain = TieredChain({TIER_FULL: full, TIER_RETRIEVAL_ONLY: lambda query: answer("excerpt")},
+                            scheduler=scheduler, max_abandoned=2)
+        try:
+            tiers = [chain.run(f"question {number}", budget=0.01)[2] for number in range(4)]
+        finally:
+            release.set()
+        self.assertEqual(tiers, [TIER_RETRIEVAL_ONLY] * 4)
+        self.assertEqual(len(started), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
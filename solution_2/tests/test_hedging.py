@@ -0,0 +1,114 @@
+"""
+Tests of HedgingPolicy admission, extra spend cap and abandoned attempt accounting.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hedging import HedgingPolicy  # noqa: E402
+
+
+class SlowPrimary:
+    """A call whose first attempt blocks until released while every later attempt returns at once."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.attempts += 1
+            attempt = self.attempts
+        if attempt == 1:
+            self.release.wait(5)
+            return "primary"
+        return "hedge"
+
+
+class HedgingPolicyTest(unittest.TestCase):
+
+    def make_policy(self, **kwargs):
+        policy = HedgingPolicy(percentile=50, min_samples=3, **kwargs)
+        for _ in range(3):
+            policy.call(lambda: "fast", tokens=10)
+        return policy
+
+    def call_slow(self, policy, **kwargs):
+        slow = SlowPrimary()
+        # Release the primary eventually, so that calls without a hedge return too
+        timer = threading.Timer(0.2, slow.release.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.addCleanup(slow.release.set)
+        return policy.call(slow, tokens=10, **kwargs), slow
+
+    def test_no_hedging_while_learning(self):
+        policy = HedgingPolicy(min_samples=20)
+        self.assertEqual(policy.call(lambda: "answer"), "answer")
+        self.assertIsNone(policy.hedge_delay())
+        self.assertEqual(policy.stats()["hedged"], 0)
+
+    def test_slow_call_is_hedged_and_the_hedge_wins(self):
+        policy = self.make_policy(max_extra_spend=1.0)
+        result, slow = self.call_slow(policy)
+        self.assertEqual(result, "hedge")
+        stats = policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"], stats["hedge_tokens"]), (1, 1, 10))
+
+    def test_hedge_refused_by_admission_is_not_sent(self):
+        policy = self.make_policy(max_extra_spend=1.0)
+        admitted = []
+        result, slow = self.call_slow(policy, admit=lambda: admitted.append(True) or False)
+        self.assertEqual(result, "primary")
+        self.assertEqual(slow.attempts, 1)
+        self.assertEqual(admitted, [True])
+        stats = policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedges_not_admitted"], stats["hedge_tokens"]), (0, 1, 0))
+
+    def test_spend_cap_limits_hedge_tokens(self):
+        # 3 warm-up calls and 2 slow calls of 10 tokens: a 25% cap allows one 10-token hedge
+        policy = self.make_policy(max_extra_spend=0.25)
+        first, _ = self.call_slow(policy)
+        second, slow = self.call_slow(policy)
+        self.assertEqual((first, second), ("hedge", "primary"))
+        self.assertEqual(slow.attempts, 1)
+        stats = policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_tokens"], stats["primary_tokens"]), (1, 10, 50))
+        self.assertLessEqual(stats["extra_spend"], 0.25)
+
+    def test_cap_is_checked_before_admission(self):
+        policy = self.make_policy(max_extra_spend=0.0)
+        admitted = []
+        result, _ = self.call_slow(policy, admit=lambda: admitted.append(True) or True)
+        self.assertEqual(result, "primary")
+        self.assertEqual(admitted, [])
+        self.assertEqual(policy.stats()["hedges_not_admitted"], 0)
+
+    def test_abandoned_attempt_is_accounted_when_it_completes(self):
+        policy = self.make_policy(max_extra_spend=1.0)
+        reported = threading.Event()
+
+        def on_abandoned(result):
+            reported.set()
+            return 7 if result == "primary" else None
+
+        result, slow = self.call_slow(policy, on_abandoned=on_abandoned)
+        self.assertEqual(result, "hedge")
+        slow.release.set()
+        self.assertTrue(reported.wait(5))
+        # The callback's accounting runs right after on_abandoned returns
+        for _ in range(100):
+            if policy.stats()["abandoned_attempts"]:
+                break
+            threading.Event().wait(0.01)
+        stats = policy.stats()
+        self.assertEqual((stats["abandoned_attempts"], stats["abandoned_tokens"]), (1, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()